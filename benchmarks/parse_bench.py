@@ -0,0 +1,152 @@
+"""
+Parse rate of the old regex parse_computation_graph vs the compiled parser (gsm_parse/calc_parser.py)
+on the model responses in data/results/*.json.
+
+The compiled parser memoizes calculation_plan, so it is timed three ways: cold, with the
+cache cleared before every response (the scan and parser alone), per pass, with the cache
+cleared before every pass over the responses (annotations repeated across responses hit),
+and warm, with every annotation already cached. Plain integer chains (10*90=900) are
+picked out by the annotation scan itself and never reach the cache, so on the bundled
+results the three rates are close: about 1.7x the legacy rate for parsing and 1.2x for
+building graphs, cold included.
+
+python benchmarks/parse_bench.py --repeat 200
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from gsm_parse.calc_parser import calculation_plan, calculation_plans
+from gsm_parse.gsm_parser import ComputationGraph, parse_computation_graph, parse_computation_graphs
+
+
+def legacy_parse_computation_graph(answer_text):
+    """parse_computation_graph before calc_parser (integers only, one operator per expression)"""
+    graph = ComputationGraph()
+    variable_meanings = {}
+    calculations = re.findall(r"<<(.*?)=(.*?)>>", answer_text)
+    for expression, result in calculations:
+        result = result.strip()
+        expression = expression.strip()
+        parts = re.findall(r"(\d+|\+|\-|\*|\/)", expression)
+        if parts:
+            numbers = [part for part in parts if part.isdigit()]
+            operators = [part for part in parts if not part.isdigit()]
+            for num in numbers:
+                graph.add_node(num, is_input=True, entity_name=variable_meanings.get(num, ""))
+            graph.add_node(result, is_input=False, entity_name=variable_meanings.get(result, ""))
+            if len(operators) > 1 and operators[0] != operators[1]:
+                raise AssertionError(f"multiple Operators mismatch: {operators}")
+            graph.add_edge(numbers, operators[0], result)
+    return graph
+
+
+def legacy_parse(answer_text):
+    """Only the parsing half of the legacy parser: (numbers, operators, result) per calculation"""
+    out = []
+    for expression, result in re.findall(r"<<(.*?)=(.*?)>>", answer_text):
+        parts = re.findall(r"(\d+|\+|\-|\*|\/)", expression.strip())
+        numbers = [part for part in parts if part.isdigit()]
+        operators = [part for part in parts if not part.isdigit()]
+        out.append((numbers, operators, result.strip()))
+    return out
+
+
+def edges(graph):
+    return {target: [(list(sources), op) for sources, op in graph.edges[target]] for target in graph.edges}
+
+
+def timed(fn, setup=None):
+    gc.collect()
+    if setup is not None:
+        setup()
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def report(name, n, t_before, t_after):
+    print(f"{name:<12} legacy {n / t_before:>10,.0f}/s   new {n / t_after:>10,.0f}/s   {t_before / t_after:>6.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=str, default="data/results/*.json")
+    parser.add_argument("--repeat", type=int, default=200, help="times every response is parsed")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    responses = []
+    for file_path in sorted(glob.glob(args.results)):
+        with open(file_path, "r") as file:
+            responses += [item.get("response", "") for item in json.load(file)]
+    texts = responses * args.repeat
+    print(f"{len(responses)} responses x {args.repeat}")
+
+    # correctness: same graphs wherever the legacy parser succeeds
+    same = failures = 0
+    for text in responses:
+        try:
+            old = legacy_parse_computation_graph(text)
+        except (AssertionError, IndexError):
+            failures += 1
+            continue
+        same += edges(old) == edges(parse_computation_graph(text))
+    print(f"legacy parser fails on {failures} / {len(responses)} responses, "
+          f"same graph on {same} / {len(responses) - failures} of the others")
+
+    def run_legacy_graphs():
+        graphs = []
+        for text in texts:
+            try:
+                graphs.append(legacy_parse_computation_graph(text))
+            except (AssertionError, IndexError):
+                graphs.append(None)
+        return graphs
+
+    def cold(parse):
+        """parse every response args.repeat times, each one starting from an empty plan cache"""
+        def run():
+            for _ in range(args.repeat):
+                for text in responses:
+                    calculation_plan.cache_clear()
+                    parse([text])
+        return run
+
+    def per_pass(parse):
+        """parse the responses args.repeat times, each pass starting from an empty plan cache"""
+        def run():
+            for _ in range(args.repeat):
+                calculation_plan.cache_clear()
+                parse(responses)
+        return run
+
+    def warm(parse):
+        return lambda: parse(texts)
+
+    def prime():
+        calculation_plan.cache_clear()
+        calculation_plans("".join(responses))
+
+    parse_plans = lambda batch: [calculation_plans(text) for text in batch]
+    parse_graphs = lambda batch: parse_computation_graphs(batch, workers=args.workers)
+    t_parse = timed(lambda: [legacy_parse(text) for text in texts])
+    t_graph = timed(run_legacy_graphs)
+    report("parse cold", len(texts), t_parse, timed(cold(parse_plans)))
+    report("parse pass", len(texts), t_parse, timed(per_pass(parse_plans)))
+    report("parse warm", len(texts), t_parse, timed(warm(parse_plans), setup=prime))
+    # one pool per response would time process start-up, cold graphs are built in this process
+    report("graph cold", len(texts), t_graph, timed(cold(lambda batch: parse_computation_graphs(batch))))
+    report("graph pass", len(texts), t_graph, timed(per_pass(parse_graphs)))
+    # worker processes do not share this process's cache, so warm is only warm without --workers
+    report("graph warm", len(texts), t_graph, timed(warm(parse_graphs), setup=prime))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Render rate of str.format vs the compiled renderer (gsm_parse/render.py).
+
+python benchmarks/render_bench.py --n 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+from gsm_parse.template_v2 import task_templates
+from gsm_parse.template_variation import question_wording, plural_wording
+from gsm_parse.render import compile_template
+
+setting = {
+    "name_format": "original",
+    "item_format": "original",
+    "flip_number_sign": False,
+    "gen_formula": False,
+    "gen_formula_sample_symbol": False,
+}
+
+
+def draw_columns(template, n, seed):
+    from gsm_parse.rng_streams import InstanceStreams, stream_key
+    import numpy as np
+
+    rng = InstanceStreams(stream_key(template.key, seed), np.arange(n))
+    columns = {key: domain.sample_batch(setting, n, rng) for key, domain in template.variables.items()}
+    columns.update(template.answer_generator(columns))
+    return {key: column.tolist() for key, column in columns.items()}
+
+
+def timed(fn):
+    start = time.perf_counter()
+    out = fn()
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200000)
+    args = parser.parse_args()
+    n = args.n
+
+    print(f"{'template':<40} {'str.format/s':>14} {'compiled/s':>14} {'speedup':>8}")
+    total_before = total_after = 0.0
+    for template in task_templates:
+        columns = draw_columns(template, n, seed=0)
+        rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+        text = template.question_template + "\n" + template.deduction_template + "\n"
+
+        before, t_before = timed(lambda: [text.format(**row) for row in rows])
+        after, t_after = timed(lambda: compile_template(text).render_columns(columns, n))
+        assert before == after
+        total_before += t_before
+        total_after += t_after
+        name = template.type_name or template.question_template[10:40] + "..."
+        print(f"{name:<40} {n / t_before:>14,.0f} {n / t_after:>14,.0f} {t_before / t_after:>7.2f}x")
+
+    # ground truth wordings, including the plural substitution on the deduction
+    template = task_templates[0]
+    columns = draw_columns(template, n, seed=1)
+    rows = [dict(zip(columns, values)) for values in zip(*columns.values())]
+    for key, wording in question_wording.items():
+        before, t_before = timed(lambda: [
+            wording.format(**row) + template.deduction_template.format(**row).replace("logs", plural_wording[key])
+            for row in rows
+        ])
+        question = compile_template(wording)
+        deduction = compile_template(template.deduction_template, {"logs": plural_wording[key]})
+        after, t_after = timed(lambda: [
+            q + d for q, d in zip(question.render_columns(columns, n), deduction.render_columns(columns, n))
+        ])
+        assert before == after
+        total_before += t_before
+        total_after += t_after
+        print(f"{'wording ' + key:<40} {n / t_before:>14,.0f} {n / t_after:>14,.0f} {t_before / t_after:>7.2f}x")
+
+    print(f"{'total':<40} {'':>14} {'':>14} {total_before / total_after:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
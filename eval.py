@@ -1,17 +1,18 @@
 import re
 import json
+import os
 import sys
+import argparse
+import random
+from collections import Counter
 
 sys.path.append("..")
-from gsm_symbolic.gsm_symbolic import generate_response
-from transformers import AutoModelForCausalLM, AutoTokenizer
-import torch
-import random
+from gsm_parse.prompt_set import load_prompt_set
+from gsm_parse.alignment import align_items, step_accuracy
 
+# torch / transformers are only imported by `main`, summarizing does not need them
 ANS_RE = re.compile(r"#### (\-?[0-9\.\,]+)")
 INVALID_ANS = "[invalid]"
-from pdb import set_trace as pds
-from pprint import pprint as pp
 
 EVAL_MODELS = {
     "gemma_9B_it": "google/gemma-2-9b-it",
@@ -38,39 +39,89 @@ def summarize_results(results):
     correct = sum(result["correct"] for result in results)
     accuracy = correct / len(results)
 
-    # correct_by_step = {}
-    # for result in results:
-    #     correct_by_step[result["deduction_step"]] = (
-    #         correct_by_step.get(result["deduction_step"], 0) + result["correct"]
-    #     )
-    correct_by_step = None
+    # fraction of responses that get each deduction step right, see gsm_parse/alignment.py
+    correct_by_step = step_accuracy(align_items(results))["correct_by_step"]
 
     return accuracy, correct_by_step
 
 
-def main(model_id, question_name):
-    if os.path.exists(f"data/results/{question_name}_{model_id}.json"):
+def main(
+    model_id,
+    question_name,
+    prompts_path="out/question_variations_with_context.json",
+    results_dir="data/results",
+    token_budget=32768,
+    max_new_tokens=1000,
+    max_batch_size=None,
+    share_prefix_tokens=0,
+    stop_on_answer=True,
+    server_url=None,
+):
+    """
+    Generate a response for every prompt, batched (see gsm_symbolic.generate_responses);
+    token_budget=0 generates one prompt at a time. model_id "tiny_random" is a tiny random
+    model on CPU (gsm_symbolic/tiny_model.py) for testing the pipeline.
+
+    share_prefix_tokens > 0 encodes the few-shot prefix of each prefix group of the prompt set
+    once and reuses its KV cache, for groups sharing at least that many tokens.
+    stop_on_answer ends a response right after its "#### <number>" line; every result records
+    its "stop_reason" (gsm_symbolic.STOP_REASONS).
+
+    With server_url, the prompts are sent to a running inference server
+    (gsm_symbolic/inference_server.py), which keeps the model loaded across runs.
+    """
+    results_path = f"{results_dir}/{question_name}_{model_id}.json"
+    if os.path.exists(results_path):
         print(f"Skipping {question_name}_{model_id} because it already exists")
         return
 
-    seed = 42
-    random.seed(seed)
-    torch.manual_seed(seed)
-    torch.cuda.manual_seed(seed)
+    # plain list of prompts or a prefix-deduplicated prompt set
+    questions = load_prompt_set(prompts_path)
 
-    model_name = EVAL_MODELS[model_id]
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name, torch_dtype=torch.bfloat16, device_map="cuda"
-    )
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if server_url:
+        from gsm_symbolic.gsm_symbolic import extract_response_answer
+        from gsm_symbolic.inference_client import InferenceClient
+        from gsm_symbolic.tiny_model import TINY_MODEL_ID
 
-    with open(f"out/question_variations_with_context.json", "r") as f:
-        questions = json.load(f)
+        results = InferenceClient(server_url).generate(
+            TINY_MODEL_ID if model_id == TINY_MODEL_ID else EVAL_MODELS[model_id],
+            [question["prompt"] for question in questions],
+            max_new_tokens=max_new_tokens, stop_on_answer=stop_on_answer,
+        )
+        responses = [extract_response_answer(result["text"]) for result in results]
+        stop_reasons = [result["stop_reason"] for result in results]
+    else:
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+        from gsm_symbolic.gsm_symbolic import generate_responses
+        from gsm_symbolic.tiny_model import TINY_MODEL_ID, load_tiny
+
+        seed = 42
+        random.seed(seed)
+        torch.manual_seed(seed)
+        torch.cuda.manual_seed(seed)
+
+        if model_id == TINY_MODEL_ID:
+            model, tokenizer = load_tiny(seed)
+        else:
+            model_name = EVAL_MODELS[model_id]
+            model = AutoModelForCausalLM.from_pretrained(
+                model_name, torch_dtype=torch.bfloat16, device_map="cuda"
+            )
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        # token_budget=0: batches of one prompt, with the same stopping and max_new_tokens
+        responses, stop_reasons = generate_responses(
+            model, tokenizer, [question["prompt"] for question in questions],
+            max_new_tokens=max_new_tokens, token_budget=token_budget,
+            max_batch_size=max_batch_size if token_budget else 1,
+            prefix_groups=questions.prefix_groups().values(), min_prefix_tokens=share_prefix_tokens,
+            stop_on_answer=stop_on_answer, return_stop_reasons=True,
+        )
 
+    # responses are in prompt order, whatever order the batches ran in
     results = []
-    for idx, question in enumerate(questions):
-        print(f'idx {idx} -- seed {question["seed"]} ---> {question["wording"]}')
-        response = generate_response(model, tokenizer, question["prompt"])
+    for question, response, stop_reason in zip(questions, responses, stop_reasons):
         results.append(
             {
                 "sample_id": question["sample_id"],
@@ -83,30 +134,62 @@ def main(model_id, question_name):
                 "response": response,
                 "response_answer": extract_answer(response),
                 "correct": question["answer"] == extract_answer(response),
+                "stop_reason": stop_reason,
             }
         )
         print(question["answer"], " ---> ", extract_answer(response), end="\n\n")
 
-    with open(f"data/results/{question_name}_{model_id}.json", "w") as f:
+    with open(results_path, "w") as f:
         json.dump(results, f, indent=4, ensure_ascii=False)
 
 
-def summarize_main(model_id, question_name):
-    with open(f"data/results/{question_name}_{model_id}.json", "r") as f:
+def summarize_main(model_id, question_name, results_dir="data/results"):
+    with open(f"{results_dir}/{question_name}_{model_id}.json", "r") as f:
         results = json.load(f)
     accuracy, correct_by_step = summarize_results(results)
     print(f"Accuracy: {accuracy:.2f}")
-    # print(f"Correct by step: {correct_by_step}")
+    stop_reasons = Counter(result.get("stop_reason") for result in results)
+    if any(stop_reasons):
+        print(f"Stop reasons: {dict(stop_reasons)}")
+    print(f"Correct by step: {correct_by_step}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", default="all", choices=["all", "run", "summarize"],
+                        help="run: generate responses; summarize: accuracy of saved results; all: both")
+    parser.add_argument("--model_ids", type=str, nargs="+", default=list(EVAL_MODELS))
+    parser.add_argument("--question_name", type=str, default="Tree_Logging_Calculation")
+    parser.add_argument("--prompts_path", type=str, default="out/question_variations_with_context.json")
+    parser.add_argument("--results_dir", type=str, default="data/results")
+    parser.add_argument("--token_budget", type=int, default=32768,
+                        help="max (prompt + new) tokens per batch, 0 generates one prompt at a time")
+    parser.add_argument("--max_batch_size", type=int, default=None)
+    parser.add_argument("--max_new_tokens", type=int, default=1000)
+    parser.add_argument("--share_prefix_tokens", type=int, default=0,
+                        help="reuse the KV cache of a shared prompt prefix of at least this many tokens, 0: off")
+    parser.add_argument("--stop_on_answer", action=argparse.BooleanOptionalAction, default=True,
+                        help="stop each response after its \"#### <number>\" line")
+    parser.add_argument("--server", type=str, default=None,
+                        help="URL of a running gsm_symbolic.inference_server, e.g. http://127.0.0.1:8765")
+    parser.add_argument("--tiny", action="store_true",
+                        help="tiny random model on CPU instead of --model_ids, to test the pipeline")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    import os
     # from config import EVAL_MODELS, EVAL_QUESTION_NAMES
-
-    os.makedirs("data/results", exist_ok=True)
-    question_name = 'Tree_Logging_Calculation'
-
-    for model_id in EVAL_MODELS:
-        main(model_id, question_name)
-        print(question_name, model_id)
-        summarize_main(model_id, question_name)
+    args = parse_args()
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    question_name = args.question_name
+    model_ids = ["tiny_random"] if args.tiny else args.model_ids
+
+    for model_id in model_ids:
+        if args.command in ["all", "run"]:
+            main(model_id, question_name, args.prompts_path, args.results_dir,
+                 args.token_budget, args.max_new_tokens, args.max_batch_size, args.share_prefix_tokens,
+                 args.stop_on_answer, args.server)
+        if args.command in ["all", "summarize"]:
+            print(question_name, model_id)
+            summarize_main(model_id, question_name, args.results_dir)
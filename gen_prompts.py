@@ -1,15 +1,12 @@
 import random
 
-from pdb import set_trace as pds
-from pprint import pprint as pp
 import argparse
 from utils import ensure_path, load_json, save_json
 import json
 
 
-from gsm_parse.template_v2 import task_templates, generate_task_with_context
-from gsm_parse.template_variation import question_wording, plural_wording
-from gsm_parse.gsm_parser import parse_computation_graph, print_ascii_tree, visualize_graph_graphviz
+from gsm_parse.template_v2 import task_templates
+from gsm_parse.prompt_set import PromptSet, save_prompt_set
 
 random.seed(42) 
 
@@ -57,32 +54,72 @@ def generate_context(setting, num_shots):
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--variable_seed", type=int, default=42)
+    parser.add_argument("--source", type=str, default="ground_truth", choices=["ground_truth", "engine"],
+                        help="ground_truth: targets from out/question_variations.json; engine: gsm_parse.variants")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[37, 42, 134, 1567, 8787])
+    parser.add_argument("--seed_range", type=int, nargs=2, default=None, metavar=("START", "STOP"))
+    parser.add_argument("--wordings", type=str, nargs="+", default=None, help="default: all wordings")
+    parser.add_argument("--format", type=str, default="full", choices=["full", "prompt_set"],
+                        help="full: every item has its whole prompt; prompt_set: shared prefixes stored once")
+    # only used with --source engine
+    parser.add_argument("--template", type=int, default=0)
+    parser.add_argument("--name_format", type=str, nargs="+", default=["original"])
+    parser.add_argument("--item_format", type=str, nargs="+", default=["original"])
+    parser.add_argument("--flip_number_sign", type=int, nargs="+", default=[0])
+    parser.add_argument("--gen_formula", type=int, nargs="+", default=[0])
     return parser.parse_args()
 
 
-def main():
-    args = parse_args()
-    full_prompt = generate_context(setting, num_shots=3)
-    # print(full_prompt)
+def iter_targets(args):
+    seeds = list(range(*args.seed_range)) if args.seed_range is not None else args.seeds
 
-    seeds=[37, 42, 134, 1567, 8787]
-    workdings = ["original", "LumberYard", "ForestManagement", "ConstructionSupply", "FurnitureMaking", "Simplified"]
+    if args.source == "engine":
+        from gsm_parse.variants import variant_axes, iter_variants
 
-    total_targets = load_json("out/question_variations.json")
-
-    feed_to_model = []
+        template = task_templates[args.template]
+        axes = variant_axes(
+            template,
+            seeds,
+            wordings=args.wordings,
+            name_format=args.name_format,
+            item_format=args.item_format,
+            flip_number_sign=[bool(v) for v in args.flip_number_sign],
+            gen_formula=[bool(v) for v in args.gen_formula],
+        )
+        yield from iter_variants(template, axes)
+        return
 
+    total_targets = load_json("out/question_variations.json")
     sample_id = 0
-
     for seed in seeds:
-        for wording in workdings:
+        wordings = args.wordings if args.wordings is not None else list(total_targets[str(seed)])
+        for wording in wordings:
             item = total_targets[str(seed)][wording]
-            item["prompt"] = full_prompt + item["question"]
             item["seed"] = seed
             item["wording"] = wording
             item["sample_id"] = sample_id
             sample_id += 1
-            feed_to_model.append(item)
+            yield item
+
+
+def main():
+    args = parse_args()
+    full_prompt = generate_context(setting, num_shots=3)
+    # print(full_prompt)
+
+    if args.format == "prompt_set":
+        prompt_set = PromptSet()
+        for target in iter_targets(args):
+            prompt_set.add(target, full_prompt, target["question"])
+        save_prompt_set(prompt_set, "out/question_variations_with_context.prompts.json")
+        return
+
+    feed_to_model = []
+    for target in iter_targets(args):
+        item = {key: target[key] for key in ["question", "deduction", "answer"]}
+        item["prompt"] = full_prompt + item["question"]
+        item.update((key, value) for key, value in target.items() if key not in item)
+        feed_to_model.append(item)
 
     save_json(feed_to_model, "out/question_variations_with_context.json")
 
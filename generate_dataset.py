@@ -0,0 +1,220 @@
+"""
+Generate a large sharded dataset from task_templates.
+
+Every (template, setting) pair is a config; each config gets --num_per_config instances
+drawn from its own per-instance streams (keyed by template, seed, setting and index), so
+configs draw independent values and the output only depends on the arguments and not on
+--workers.
+
+python generate_dataset.py --num_per_config 100000 --shard_size 100000 --gzip
+"""
+import argparse
+import gzip
+import itertools
+import json
+import os
+import time
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+from utils import ensure_path, save_json
+from gsm_parse.dedup import make_index
+from gsm_parse.template_v2 import task_templates
+
+# all `setting` axes that change the generated text
+FORMATS = {
+    "name_format": ["original", "symbol"],
+    "item_format": ["original", "symbol"],
+    "flip_number_sign": [False, True],
+    "gen_formula": [False, True],
+}
+
+
+def iter_settings(formats, gen_formula_sample_symbol=False):
+    """
+    Distinct settings of the product of formats. Formulas replace every number by a symbol
+    before the sign would be flipped, so with gen_formula the flip variants collapse into
+    flip_number_sign=False.
+    """
+    keys = list(formats)
+    seen = set()
+    for values in itertools.product(*(formats[key] for key in keys)):
+        setting = dict(zip(keys, values))
+        if setting.get("gen_formula"):
+            setting["flip_number_sign"] = False
+        setting["gen_formula_sample_symbol"] = gen_formula_sample_symbol
+        key = setting_key(setting)
+        if key not in seen:
+            seen.add(key)
+            yield setting
+
+
+def setting_key(setting):
+    """Stable, hashable form of a setting, also the salt of the config's random streams"""
+    return tuple(sorted(setting.items()))
+
+
+def iter_blocks(configs, num_per_config, block_size, seed, dedup=False):
+    """Split every config into blocks of at most block_size instances"""
+    for config_id, config in enumerate(configs):
+        for start in range(0, num_per_config, block_size):
+            yield (config_id, config, seed, start, min(block_size, num_per_config - start), dedup)
+
+
+def generate_block(task):
+    """
+    Worker: render one block of instances as JSON lines.
+
+    Returns:
+        (type_name, instance hashes or None, lines)
+    """
+    config_id, config, seed, start, n, dedup = task
+    template = task_templates[config["template_id"]]
+    rng = template.streams(seed, np.arange(start, start + n), salt=setting_key(config["setting"]))
+    columns = template.sample_columns(config["setting"], n, rng)
+    hashes = template.instance_hashes(columns, n) if dedup else None
+    instances = template.render_batch(columns, n)
+    lines = []
+    for i, instance in enumerate(instances):
+        instance["config_id"] = config_id
+        instance["index"] = start + i
+        lines.append(json.dumps(instance, ensure_ascii=False) + "\n")
+    return template.type_name, hashes, lines
+
+
+def bounded_imap(pool, func, tasks, max_pending):
+    """Like pool.imap, but never submits more than max_pending tasks ahead of the consumer"""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(func, (task,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+class ShardWriter:
+    """Write lines into fixed-size shards shard-00000.jsonl[.gz], ..."""
+
+    def __init__(self, out_dir, shard_size, compress=False, compresslevel=6):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.compress = compress
+        self.compresslevel = compresslevel
+        self.shards = []
+        self.file = None
+        self.count = 0
+
+    def _open(self):
+        name = f"shard-{len(self.shards):05d}.jsonl" + (".gz" if self.compress else "")
+        self.path = os.path.join(self.out_dir, name)
+        if self.compress:
+            self.file = gzip.open(self.path + ".tmp", "wt", encoding="utf-8", compresslevel=self.compresslevel)
+        else:
+            self.file = open(self.path + ".tmp", "w", encoding="utf-8")
+        self.count = 0
+
+    def _close(self):
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+        self.shards.append({
+            "file": os.path.basename(self.path),
+            "num_records": self.count,
+            "bytes": os.path.getsize(self.path),
+        })
+        self.file = None
+
+    def write_lines(self, lines):
+        while lines:
+            if self.file is None:
+                self._open()
+            chunk = lines[: self.shard_size - self.count]
+            self.file.writelines(chunk)
+            self.count += len(chunk)
+            lines = lines[len(chunk):]
+            if self.count == self.shard_size:
+                self._close()
+
+    def close(self):
+        if self.file is not None:
+            self._close()
+        return self.shards
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out_dir", type=str, default="out/dataset")
+    parser.add_argument("--num_per_config", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--templates", type=int, nargs="*", default=None, help="template indices, default all")
+    parser.add_argument("--name_format", nargs="+", default=FORMATS["name_format"])
+    parser.add_argument("--item_format", nargs="+", default=FORMATS["item_format"])
+    parser.add_argument("--flip_number_sign", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--gen_formula", type=int, nargs="+", default=[0, 1])
+    parser.add_argument("--gen_formula_sample_symbol", action="store_true")
+    parser.add_argument("--shard_size", type=int, default=100000)
+    parser.add_argument("--block_size", type=int, default=10000, help="instances per worker task")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--dedup", choices=["exact", "bloom"], default=None,
+                        help="drop instances whose (template, variables) was already written")
+    parser.add_argument("--bloom_capacity", type=int, default=None, help="default: total number of instances")
+    parser.add_argument("--bloom_error_rate", type=float, default=1e-4)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    ensure_path(args.out_dir)
+
+    formats = {
+        "name_format": args.name_format,
+        "item_format": args.item_format,
+        "flip_number_sign": [bool(v) for v in args.flip_number_sign],
+        "gen_formula": [bool(v) for v in args.gen_formula],
+    }
+    template_ids = args.templates if args.templates is not None else range(len(task_templates))
+    configs = [
+        {"template_id": template_id, "type_name": task_templates[template_id].type_name, "setting": setting}
+        for template_id in template_ids
+        for setting in iter_settings(formats, args.gen_formula_sample_symbol)
+    ]
+
+    index = None
+    if args.dedup is not None:
+        capacity = args.bloom_capacity or len(configs) * args.num_per_config
+        index = make_index(args.dedup, capacity, args.bloom_error_rate)
+
+    start_time = time.time()
+    writer = ShardWriter(args.out_dir, args.shard_size, compress=args.gzip)
+    tasks = iter_blocks(configs, args.num_per_config, args.block_size, args.seed, dedup=index is not None)
+    with Pool(args.workers) as pool:
+        for type_name, hashes, lines in bounded_imap(pool, generate_block, tasks, max_pending=2 * args.workers):
+            # blocks arrive in order, so the first occurrence of an instance is the one kept
+            if index is not None:
+                keep = index.add(type_name, hashes)
+                lines = [line for line, k in zip(lines, keep) if k]
+            writer.write_lines(lines)
+    shards = writer.close()
+    elapsed = time.time() - start_time
+
+    num_records = sum(shard["num_records"] for shard in shards)
+    manifest = {
+        "args": vars(args),
+        "num_records": num_records,
+        "elapsed_sec": elapsed,
+        "configs": configs,
+        "shards": shards,
+        "dedup": index.summary() if index is not None else None,
+    }
+    save_json(manifest, os.path.join(args.out_dir, "manifest.json"))
+    print(f"{num_records} records in {len(shards)} shards, {elapsed:.1f}s ({num_records / max(elapsed, 1e-9):.0f}/s)")
+    if index is not None:
+        for type_name, stats in index.summary()["templates"].items():
+            print(f"  {type_name:<30} {stats['duplicates']:>10} / {stats['seen']:<10} duplicates ({stats['collision_rate']:.2%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,16 @@
 import random
 import os
-from pdb import set_trace as pds
-from pprint import pprint as pp
 import argparse
-from utils import ensure_path, load_json, save_json
+from multiprocessing import Pool
+from utils import ensure_path, load_json, save_json, save_json_atomic, file_lock
 import json
 
 
 from gsm_parse.template_v2 import task_templates, generate_task_with_context
 from gsm_parse.template_variation import question_wording, plural_wording
-from gsm_parse.gsm_parser import parse_computation_graph, print_ascii_tree, visualize_graph, visualize_graph_graphviz
+from gsm_parse.render import compile_template
+from gsm_parse.gsm_parser import parse_computation_graph, print_ascii_tree, visualize_graph
+from gsm_parse.graph_render import GraphRenderer
 
 setting = {
         "name_format": "original",  # "original" | "symbol"
@@ -33,13 +34,16 @@ def extract_final_answer(answer_text: str):
     return answer
     
 
-def wording_variation(variable_seed = 42):
+def wording_variation(variable_seed = 42, graph = True, verbose = True, renderer = None):
+    """renderer: GraphRenderer the computation graphs are queued on, flushed by the caller"""
+    from pprint import pprint as pp
+
     results = {}
-    graph = True
     index = 0  ## "Tree Logging Calculation"
     template = task_templates[index]
 
-    variables = template.variable_generator(setting) # controlled by variable_seed
+    # unconstrained draw: reproduces the evaluated seeds (seed 1567 repeats an item)
+    variables = template.variable_generator(setting, constrained=False) # controlled by variable_seed
     answer_dict = template.answer_generator(variables) # controlled by variable_seed
     variables.update(answer_dict)
 
@@ -53,11 +57,13 @@ def wording_variation(variable_seed = 42):
             file.write(json_line + '\n')
 
     # pp(variables)
-    question_text = template.question_template.format(**variables)
+    question_text = compile_template(template.question_template).render(variables)
 
-    print(f"question_text: {question_text}")
-    answer_text = template.deduction_template.format(**variables)
-    print(f"answer_text: {answer_text}")
+    if verbose:
+        print(f"question_text: {question_text}")
+    answer_text = compile_template(template.deduction_template).render(variables)
+    if verbose:
+        print(f"answer_text: {answer_text}")
 
     results["original"] = {
         "question": question_text,
@@ -67,21 +73,24 @@ def wording_variation(variable_seed = 42):
 
 
     if graph:
-        graph = parse_computation_graph(answer_text, template, variables)
-        visualize_graph_graphviz(graph, output_file = f"out/seed{variable_seed}/ground_truth/original_computation_graph")
+        renderer.add(parse_computation_graph(answer_text, template, variables),
+                     f"out/seed{variable_seed}/ground_truth/original_computation_graph")
 
 
     for key, val in question_wording.items():
-        pp(f"== {key} =====================================================")
-        question_text = val.format(**variables)
-        print(question_text)
+        if verbose:
+            pp(f"== {key} =====================================================")
+        question_text = compile_template(val).render(variables)
+        if verbose:
+            print(question_text)
         # pp("===  answer  ==========================================================")
-        answer_text = template.deduction_template.format(**variables).replace("logs",plural_wording[key])
-        print(f"answer_text: {answer_text}")
+        answer_text = compile_template(template.deduction_template, {"logs": plural_wording[key]}).render(variables)
+        if verbose:
+            print(f"answer_text: {answer_text}")
 
         if graph:
-            graph = parse_computation_graph(answer_text, template, variables)
-            visualize_graph_graphviz(graph, output_file = f"out/seed{variable_seed}/ground_truth/{key}_computation_graph")
+            renderer.add(parse_computation_graph(answer_text, template, variables),
+                         f"out/seed{variable_seed}/ground_truth/{key}_computation_graph")
         
         results[key] = {
             "question": question_text,
@@ -92,33 +101,76 @@ def wording_variation(variable_seed = 42):
     return results
 
 
-def main():
-    args = parse_args()
-    variable_seed = args.variable_seed
+def run_seed(variable_seed, graph = True, verbose = True, graph_format = "png"):
+    """
+    Wording variations for one seed, also saved to out/seed{variable_seed}/question_variations.json
+
+    Returns:
+        (results, graph jobs): the (DOT text, output file) of every computation graph, not
+        rendered yet so that the caller renders all seeds at once
+    """
     ensure_path(f"out/seed{variable_seed}")
-    random.seed(variable_seed) 
+    random.seed(variable_seed)
+    # only collects the graphs, it is never flushed
+    renderer = GraphRenderer(format = graph_format)
+    results = {str(variable_seed): wording_variation(variable_seed = variable_seed, graph = graph, verbose = verbose, renderer = renderer)}
 
-    # wording_variation()
+    output_path = f"out/seed{variable_seed}/question_variations.json"
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent = 4)
+    return results, renderer.pending
 
-    # Generate and save results
-    results = {str(variable_seed): wording_variation(variable_seed = variable_seed)}
 
-    # Save to JSON file
-    output_path = f"out/seed{variable_seed}/question_variations.json"
-    save_json(results, output_path)
+def _run_seed(job):
+    return run_seed(*job)
+
 
-    ### combine into one file
-    total = {}
+def main():
+    args = parse_args()
+    if args.seed_range is not None:
+        seeds = list(range(*args.seed_range))
+    elif args.variable_seeds is not None:
+        seeds = args.variable_seeds
+    else:
+        seeds = [args.variable_seed]
+    verbose = len(seeds) == 1
+    jobs = [(seed, not args.no_graph, verbose, args.graph_format) for seed in seeds]
+
+    # Generate results, every seed is independent
+    if args.workers > 1 and len(seeds) > 1:
+        with Pool(args.workers) as pool:
+            outputs = list(pool.imap(_run_seed, jobs, chunksize = max(1, len(jobs) // (args.workers * 8))))
+    else:
+        outputs = [_run_seed(job) for job in jobs]
+
+    # the graphs of all seeds go through one renderer, so wordings and seeds that share a
+    # graph structure cost a single graphviz render
+    results = {}
+    renderer = GraphRenderer(format = args.graph_format, workers = args.workers)
+    for result, graph_jobs in outputs:
+        results.update(result)
+        for dot_text, output_file in graph_jobs:
+            renderer.add_dot(dot_text, output_file)
+    renderer.flush()
+
+    ### combine into one file, written once
     total_path = f"out/question_variations.json"
-    # Try to load existing data if the file exists and is not empty
-    if os.path.isfile(total_path) and os.path.getsize(total_path) > 0:
-        total = load_json(total_path)
-    total.update(results)
-    save_json(total, total_path)
+    with file_lock(total_path):
+        total = {}
+        # Try to load existing data if the file exists and is not empty
+        if os.path.isfile(total_path) and os.path.getsize(total_path) > 0:
+            total = load_json(total_path)
+        total.update(results)
+        save_json_atomic(total, total_path)
 
 def parse_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--variable_seed", type=int, default=42)
+    parser.add_argument("--variable_seeds", type=int, nargs="+", default=None, help="several seeds, overrides --variable_seed")
+    parser.add_argument("--seed_range", type=int, nargs=2, default=None, metavar=("START", "STOP"), help="seeds in range(START, STOP)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no_graph", action="store_true", help="skip rendering the ground truth computation graphs")
+    parser.add_argument("--graph_format", type=str, default="png", help='graphviz output format, "dot" writes the DOT text only')
     return parser.parse_args()
 
 if __name__ == "__main__":
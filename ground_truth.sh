@@ -3,10 +3,7 @@
 # Array of seed values
 seeds=(37 42 134 1567 8787)
 
-# Loop through each seed
-for seed in "${seeds[@]}"
-do
-    echo "Running with seed: $seed"
-    python ground_truth.py --variable_seed $seed
-    echo "----------------------------------------"
-done
\ No newline at end of file
+# All seeds in one run: computed in parallel, merged into out/question_variations.json once
+echo "Running with seeds: ${seeds[@]}"
+python ground_truth.py --variable_seeds "${seeds[@]}"
+echo "----------------------------------------"
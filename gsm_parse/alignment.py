@@ -0,0 +1,179 @@
+"""
+Step-level alignment of a response's computation graph with the ground-truth graph.
+
+Every edge of the ground-truth graph is a step. Steps are aligned in order: a step
+matches a response edge with the same operation whose sources are the ground-truth
+sources, where sources that are results of earlier steps are replaced by what the
+response got for those steps (operand order only matters for - and /). If there is no
+such edge, a response edge that arrives at the expected value by another computation
+is accepted as well. Each response edge is used at most once.
+
+Steps still unmatched then fall back to position: the first unused response edge with the
+same operation and number of operands between the response edges of the neighbouring
+matched steps, so a step with a misread operand is not reported as missing plus extra.
+
+Step status:
+    correct      expected value
+    arithmetic   right operands, wrong result, or wrong operands and a wrong result for them
+    propagated   result is right for the response's own operands, which were already wrong
+    misread      result is right for operands that are neither the ground truth's nor
+                 what the response got in earlier steps (matched by position)
+    missing      no response step for it
+Response steps left over are "extra".
+"""
+from collections import Counter
+from multiprocessing import Pool
+
+from .calc_parser import evaluate, format_number, parse_expression, CalcSyntaxError
+from .gsm_parser import parse_computation_graph
+
+COMMUTATIVE = {"+", "*"}
+STATUSES = ["correct", "arithmetic", "propagated", "misread", "missing"]
+
+
+def _operands_key(op, sources):
+    return (op, tuple(sorted(sources)) if op in COMMUTATIVE else tuple(sources))
+
+
+def _apply(op, sources):
+    """Value of op over the source values, None if they are not numbers"""
+    try:
+        value = evaluate(parse_expression(op.join(f"({source})" for source in sources)))
+    except (CalcSyntaxError, ValueError, ZeroDivisionError):
+        return None
+    return format_number(value) if value is not None else None
+
+
+def align_graphs(gt_graph, response_graph):
+    """
+    Returns:
+        {"steps": [{"step", "op", "sources", "expected", "got", "status"}],
+         "extra": [{"op", "sources", "got"}]}
+    """
+    response_edges = list(response_graph.iter_edges())
+    by_operands = {}
+    by_target = {}
+    for i, (sources, op, target) in enumerate(response_edges):
+        by_operands.setdefault(_operands_key(op, sources), []).append(i)
+        by_target.setdefault(target, []).append(i)
+    used = set()
+    # ground-truth value -> what the response got for it
+    got_for = {}
+
+    def take(candidates):
+        for i in candidates or []:
+            if i not in used:
+                used.add(i)
+                return i
+        return None
+
+    gt_edges = list(gt_graph.iter_edges())
+    # response edge of every step, None if missing
+    matched = []
+    for sources, op, expected in gt_edges:
+        mapped = [got_for.get(source, source) for source in sources]
+        i = take(by_operands.get(_operands_key(op, mapped)))
+        if i is None:
+            i = take(by_target.get(expected))
+        matched.append(i)
+        if i is not None:
+            got_for[expected] = response_edges[i][2]
+
+    for step, (sources, op, expected) in enumerate(gt_edges):
+        if matched[step] is not None:
+            continue
+        low = max((i for i in matched[:step] if i is not None), default=-1)
+        high = min((i for i in matched[step + 1:] if i is not None), default=len(response_edges))
+        for i in range(low + 1, high):
+            if i not in used and response_edges[i][1] == op and len(response_edges[i][0]) == len(sources):
+                used.add(i)
+                matched[step] = i
+                break
+
+    # statuses once every step is matched, with what the response got for the position matches too
+    got_for = {}
+    steps = []
+    for step, ((sources, op, expected), i) in enumerate(zip(gt_edges, matched)):
+        mapped = [got_for.get(source, source) for source in sources]
+        if i is None:
+            status, got = "missing", None
+        else:
+            own, _, got = response_edges[i]
+            if got == expected:
+                status = "correct"
+            elif mapped != list(sources) and _apply(op, mapped) == got:
+                status = "propagated"
+            elif _operands_key(op, own) != _operands_key(op, mapped) and _apply(op, own) == got:
+                status = "misread"
+            else:
+                status = "arithmetic"
+            got_for[expected] = got
+        steps.append({
+            "step": step, "op": op, "sources": sources, "expected": expected, "got": got, "status": status,
+        })
+
+    extra = [
+        {"op": op, "sources": sources, "got": target}
+        for i, (sources, op, target) in enumerate(response_edges)
+        if i not in used
+    ]
+    return {"steps": steps, "extra": extra}
+
+
+def align_texts(deduction, response):
+    """align_graphs for a ground-truth deduction and a response text"""
+    return align_graphs(parse_computation_graph(deduction), parse_computation_graph(response))
+
+
+def step_summary(alignment):
+    """Counts per status, number of extra steps and the first step that is not correct"""
+    counts = Counter(step["status"] for step in alignment["steps"])
+    first_error = next((step["step"] for step in alignment["steps"] if step["status"] != "correct"), None)
+    return {
+        **{status: counts.get(status, 0) for status in STATUSES},
+        "extra": len(alignment["extra"]),
+        "num_steps": len(alignment["steps"]),
+        "first_error_step": first_error,
+    }
+
+
+def step_accuracy(alignments):
+    """
+    Step-level accuracy curves over many samples.
+
+    Returns:
+        {"correct_by_step": {step: fraction of samples with that step correct},
+         "prefix_correct_by_step": {step: fraction with steps 0..step all correct},
+         "status_counts": {status: count}, "extra_steps": count}
+    """
+    totals, correct, prefix = Counter(), Counter(), Counter()
+    status_counts = Counter()
+    extra = 0
+    for alignment in alignments:
+        all_correct = True
+        for step in alignment["steps"]:
+            totals[step["step"]] += 1
+            status_counts[step["status"]] += 1
+            ok = step["status"] == "correct"
+            correct[step["step"]] += ok
+            all_correct = all_correct and ok
+            prefix[step["step"]] += all_correct
+        extra += len(alignment["extra"])
+    return {
+        "correct_by_step": {step: correct[step] / totals[step] for step in sorted(totals)},
+        "prefix_correct_by_step": {step: prefix[step] / totals[step] for step in sorted(totals)},
+        "status_counts": {status: status_counts.get(status, 0) for status in STATUSES},
+        "extra_steps": extra,
+    }
+
+
+def _align_item(item):
+    return align_texts(item["deduction"], item.get("response", ""))
+
+
+def align_items(items, workers=None, chunksize=64):
+    """Alignments of many result items ({"deduction", "response"}), in order"""
+    if workers is None or workers <= 1:
+        return [_align_item(item) for item in items]
+    with Pool(workers) as pool:
+        return pool.map(_align_item, items, chunksize=chunksize)
@@ -0,0 +1,279 @@
+"""
+Parser for the <<expression=result>> calculator annotations of GSM8K-style answers.
+
+Every annotation is tokenized in one finditer pass of a compiled regex and parsed by
+precedence climbing, so it handles decimals, thousands separators, "$", parentheses, unary
+minus and mixed operators (2*3+4). Operands that are not numbers (the symbols of formula
+answers, e.g. x*y) are kept as names. The common case, numbers joined by one operator
+(10*90, 900+288+372), is recognized by a single fullmatch and skips the tokenizer;
+calculation_plans picks out plain integer chains while it scans the text for annotations.
+
+A parsed expression is a nested tuple:
+    ("num", text)                       number, text normalized ("$1,200.50" -> "1200.5")
+    ("name", text)                      symbol
+    (op, (operand, operand, ...))       op in + - * /, folded left to right; chains of
+                                        one operator are flattened (a+b+c, a-b-c)
+
+Model responses repeat the same annotations a lot (copied few-shot examples, small
+variable domains), so the graph-building plan of an annotation is memoized.
+"""
+import re
+from functools import lru_cache
+
+CALC_RE = re.compile(r"<<([^<>]*?)=([^<>=]*?)>>")
+_NUMBER = r"\$?\d[\d,]*(?:\.\d+)?|\$?\.\d+"
+_TOKEN = re.compile(
+    r"\s*(?:"
+    rf"(?P<num>{_NUMBER})"
+    r"|(?P<op>[+\-*/×÷])"
+    r"|(?P<lp>\()"
+    r"|(?P<rp>\))"
+    r"|(?P<name>[^\s\d+\-*/×÷()]+)"
+    r"|(?P<error>\S)"
+    r")"
+)
+# every annotation of a text in one pass; the first branch is the plain case, integers
+# joined by one operator without spaces (10*90=900), the second is CALC_RE
+_PLAN_RE = re.compile(r"<<(?:(\d+(?:([+\-*/])\d+(?:\2\d+)*)?)=(-?[1-9]\d*|0)>>|([^<>]*?)=([^<>=]*?)>>)")
+_NUMBER_RE = re.compile(_NUMBER)
+# numbers joined by one repeated operator, e.g. 900+288+372
+_CHAIN = re.compile(rf"\s*(?:{_NUMBER})(?:\s*([+\-*/])\s*(?:{_NUMBER})(?:\s*\1\s*(?:{_NUMBER}))*)?\s*")
+_SIGNED_NUMBER = re.compile(rf"\s*(-?)\s*({_NUMBER})\s*")
+_OPS = {"+": "+", "-": "-", "*": "*", "/": "/", "×": "*", "÷": "/", "x": "*", "X": "*"}
+_PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+
+class CalcSyntaxError(ValueError):
+    pass
+
+
+def normalize_number(text):
+    """Canonical text of a number: no "$" or commas, no trailing decimal zeros"""
+    if text.isdigit():
+        return text
+    text = text.replace("$", "").replace(",", "")
+    if "." in text:
+        text = text.rstrip("0").rstrip(".") or "0"
+    return text
+
+
+def format_number(value):
+    if isinstance(value, float):
+        if value.is_integer():
+            return str(int(value))
+        return normalize_number(f"{value:.10f}")
+    return str(value)
+
+
+def tokenize(expression):
+    """[(kind, text)], kind in num / op / lp / rp / name"""
+    tokens = [(match.lastgroup, match[match.lastgroup]) for match in _TOKEN.finditer(expression)]
+    for kind, text in tokens:
+        if kind == "error":
+            raise CalcSyntaxError(f"unexpected {expression[expression.index(text):]!r}")
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def operator(self):
+        """Binary operator at the current position, "x" between operands is a multiplication"""
+        kind, text = self.peek()
+        if kind == "op" or (kind == "name" and text in ("x", "X")):
+            return _OPS[text]
+        return None
+
+    def operand(self):
+        kind, text = self.next()
+        if kind == "num":
+            return ("num", normalize_number(text))
+        if kind == "name":
+            return ("name", text)
+        if kind == "op" and text == "-":
+            inner = self.operand()
+            if inner[0] == "num":
+                return ("num", inner[1][1:] if inner[1].startswith("-") else "-" + inner[1])
+            return ("-", (("num", "0"), inner))
+        if kind == "lp":
+            inner = self.expression(1)
+            if self.next()[0] != "rp":
+                raise CalcSyntaxError("missing )")
+            return inner
+        raise CalcSyntaxError(f"unexpected {text!r}")
+
+    def expression(self, min_precedence):
+        left = self.operand()
+        while True:
+            op = self.operator()
+            if op is None or _PRECEDENCE[op] < min_precedence:
+                return left
+            self.next()
+            right = self.expression(_PRECEDENCE[op] + 1)
+            # flatten left-associative chains of one operator, a-b-c -> ("-", [a, b, c])
+            if left[0] == op:
+                left = (op, left[1] + (right,))
+            else:
+                left = (op, (left, right))
+
+
+def _chain(expression):
+    """(op, normalized numbers) of numbers joined by one operator, op None for a single number"""
+    match = _CHAIN.fullmatch(expression)
+    if match is None:
+        return None
+    return match[1], tuple(map(normalize_number, _NUMBER_RE.findall(expression)))
+
+
+def parse_expression(expression):
+    """Parse one expression into a nested tuple (see module docstring)"""
+    chain = _chain(expression)
+    if chain is not None:
+        op, numbers = chain
+        return (op, tuple(("num", number) for number in numbers)) if op else ("num", numbers[0])
+    parser = _Parser(tokenize(expression))
+    tree = parser.expression(1)
+    if parser.position != len(parser.tokens):
+        raise CalcSyntaxError(f"trailing {parser.tokens[parser.position][1]!r}")
+    return tree
+
+
+def parse_result(result):
+    """
+    Normalized result of a calculation: the signed number if the whole result is one,
+    otherwise the stripped text (e.g. a formula).
+
+    >>> parse_result("$900"), parse_result("-49"), parse_result("-0.5"), parse_result(" y/x*2 ")
+    ('900', '-49', '-0.5', 'y/x*2')
+    """
+    match = _SIGNED_NUMBER.fullmatch(result)
+    if match is None:
+        return result.strip()
+    number = normalize_number(match[2])
+    return "-" + number if match[1] and number != "0" else number
+
+
+def evaluate(tree):
+    """Numeric value of a tree, None if it contains names"""
+    kind = tree[0]
+    if kind == "num":
+        text = tree[1]
+        return float(text) if "." in text else int(text)
+    if kind == "name":
+        return None
+    values = [evaluate(operand) for operand in tree[1]]
+    if any(value is None for value in values):
+        return None
+    value = values[0]
+    for other in values[1:]:
+        if kind == "+":
+            value = value + other
+        elif kind == "-":
+            value = value - other
+        elif kind == "*":
+            value = value * other
+        elif other == 0:
+            return None
+        else:
+            value = value / other
+            if value == int(value):
+                value = int(value)
+    return value
+
+
+def render(tree):
+    """Text of a tree, used as the node of intermediate results without a numeric value"""
+    kind = tree[0]
+    if kind in ("num", "name"):
+        return tree[1]
+    parts = []
+    for i, operand in enumerate(tree[1]):
+        text = render(operand)
+        if operand[0] in _PRECEDENCE and (
+            _PRECEDENCE[operand[0]] < _PRECEDENCE[kind]
+            or (i > 0 and kind in "-/" and _PRECEDENCE[operand[0]] == _PRECEDENCE[kind])
+        ):
+            text = f"({text})"
+        parts.append(text)
+    return kind.join(parts)
+
+
+def parse_calculations(text):
+    """
+    All <<expression=result>> annotations of a text.
+
+    Returns:
+        list of (tree, result), annotations that do not parse are skipped
+    """
+    calculations = []
+    for expression, result in CALC_RE.findall(text):
+        try:
+            tree = parse_expression(expression)
+        except CalcSyntaxError:
+            continue
+        calculations.append((tree, parse_result(result)))
+    return calculations
+
+
+@lru_cache(maxsize=1 << 16)
+def calculation_plan(expression, result):
+    """
+    Steps that add one annotation to a ComputationGraph, None if it does not parse.
+
+    Returns:
+        tuple of ("input", value) and ("edge", sources, op, target), in insertion order:
+        operands left to right (intermediate results of mixed operators right after their
+        own operands), the final edge to `result` last
+    """
+    chain = _chain(expression)
+    if chain is not None:
+        op, numbers = chain
+        inputs = tuple(("input", number) for number in numbers)
+        return inputs + (("edge", numbers, op or "=", parse_result(result)),)
+    try:
+        tree = parse_expression(expression)
+    except CalcSyntaxError:
+        return None
+    steps = []
+
+    def add(tree):
+        if tree[0] in ("num", "name"):
+            steps.append(("input", tree[1]))
+            return tree[1]
+        sources = tuple(add(operand) for operand in tree[1])
+        value = evaluate(tree)
+        value = format_number(value) if value is not None else render(tree)
+        steps.append(("edge", sources, tree[0], value))
+        return value
+
+    if tree[0] in ("num", "name"):
+        sources, op = (add(tree),), "="
+    else:
+        sources, op = tuple(add(operand) for operand in tree[1]), tree[0]
+    steps.append(("edge", sources, op, parse_result(result)))
+    return tuple(steps)
+
+
+def calculation_plans(text):
+    """calculation_plan of every annotation of a text that parses"""
+    plans = []
+    for chain, op, chain_result, expression, result in _PLAN_RE.findall(text):
+        if chain:
+            # already normalized, the plan is built without parsing or the cache
+            numbers = tuple(chain.split(op)) if op else (chain,)
+            plans.append(tuple(("input", number) for number in numbers) + (("edge", numbers, op or "=", chain_result),))
+            continue
+        plan = calculation_plan(expression, result)
+        if plan is not None:
+            plans.append(plan)
+    return plans
@@ -0,0 +1,164 @@
+"""
+Uniqueness index for generated instances.
+
+An instance is identified by a canonical 64-bit hash of (template, variables), where the
+variables are the values that end up in the text (after the name / item / sign / formula
+settings), so two instances with the same hash render the same question. Two indexes:
+
+- ExactIndex: a set of hashes, exact, memory grows with the number of instances
+- BloomIndex: fixed-size Bloom filter for very large streams; a small fraction
+  (about error_rate) of new instances is wrongly reported as a duplicate
+
+Both take hashes in batches and report, per template, how many were seen and dropped.
+"""
+import math
+import numpy as np
+
+from .rng_streams import _GOLDEN, _mix, stream_key
+
+
+def instance_hashes(template, columns, n):
+    """
+    Canonical hash of the variables of n instances.
+
+    Args:
+        columns: {name: list or NumPy array of length n}, as from template.sample_columns
+
+    Returns:
+        uint64 array of length n
+    """
+    hashes = np.full(n, template.key, dtype=np.uint64)
+    for key in sorted(template.variables):
+        column = columns[key]
+        column = column.tolist() if hasattr(column, "tolist") else column
+        # hash every distinct value once
+        codes = {}
+        inverse = np.fromiter((codes.setdefault(value, len(codes)) for value in column), dtype=np.int64, count=n)
+        value_hashes = np.array([stream_key(key, value) for value in codes], dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            hashes = _mix(hashes ^ (value_hashes[inverse] + _GOLDEN))
+    return hashes
+
+
+class DedupStats:
+    def __init__(self):
+        self.seen = {}
+        self.duplicates = {}
+
+    def update(self, name, seen, duplicates):
+        self.seen[name] = self.seen.get(name, 0) + seen
+        self.duplicates[name] = self.duplicates.get(name, 0) + duplicates
+
+    def summary(self):
+        """{template: {"seen", "duplicates", "collision_rate"}}"""
+        return {
+            name: {
+                "seen": seen,
+                "duplicates": self.duplicates[name],
+                "collision_rate": self.duplicates[name] / seen if seen else 0.0,
+            }
+            for name, seen in self.seen.items()
+        }
+
+
+def _first_in_batch(hashes):
+    """Mask of the first occurrence of every hash within the batch"""
+    first = np.zeros(len(hashes), dtype=bool)
+    first[np.unique(hashes, return_index=True)[1]] = True
+    return first
+
+
+class ExactIndex:
+    kind = "exact"
+
+    def __init__(self):
+        self.hashes = set()
+        self.stats = DedupStats()
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def add(self, name, hashes):
+        """
+        Add a batch of instance hashes of template `name`.
+
+        Returns:
+            bool mask, True for instances not seen before (in earlier batches or earlier in this one)
+        """
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        keep = _first_in_batch(hashes)
+        index = self.hashes
+        for i in np.flatnonzero(keep):
+            value = int(hashes[i])
+            if value in index:
+                keep[i] = False
+            else:
+                index.add(value)
+        self.stats.update(name, len(hashes), int(len(hashes) - keep.sum()))
+        return keep
+
+    def summary(self):
+        return {"kind": self.kind, "size": len(self), "templates": self.stats.summary()}
+
+
+class BloomIndex:
+    kind = "bloom"
+
+    def __init__(self, capacity, error_rate=1e-4):
+        """
+        Args:
+            capacity: expected number of distinct instances
+            error_rate: false positive rate at capacity
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.num_bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+        self.stats = DedupStats()
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, hashes):
+        """(n, num_hashes) bit positions by double hashing"""
+        with np.errstate(over="ignore"):
+            step = _mix(hashes ^ _GOLDEN) | np.uint64(1)
+            k = np.arange(self.num_hashes, dtype=np.uint64)
+            return (hashes[:, None] + k[None, :] * step[:, None]) % np.uint64(self.num_bits)
+
+    def add(self, name, hashes):
+        """Same as ExactIndex.add"""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        keep = _first_in_batch(hashes)
+        positions = self._positions(hashes[keep])
+        present = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        new = ~present.all(axis=1)
+        keep[np.flatnonzero(keep)[~new]] = False
+
+        positions = positions[new].ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += int(new.sum())
+        self.stats.update(name, len(hashes), int(len(hashes) - keep.sum()))
+        return keep
+
+    def summary(self):
+        return {
+            "kind": self.kind,
+            "size": len(self),
+            "capacity": self.capacity,
+            "error_rate": self.error_rate,
+            "num_bits": self.num_bits,
+            "num_hashes": self.num_hashes,
+            "templates": self.stats.summary(),
+        }
+
+
+def make_index(kind, capacity=None, error_rate=1e-4):
+    """ExactIndex for kind "exact", BloomIndex for kind "bloom" (needs capacity)"""
+    if kind == "exact":
+        return ExactIndex()
+    if kind == "bloom":
+        return BloomIndex(capacity, error_rate)
+    raise ValueError(f"unknown dedup index {kind}")
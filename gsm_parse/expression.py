@@ -0,0 +1,170 @@
+"""
+Expression DAG for the computation of a template.
+
+A template declares its steps once, e.g.
+
+    computation={
+        "total_pine": V("pine_logs") * V("pine_count"),
+        ...
+        "total": V("total_pine") + V("total_maple") + V("total_walnut"),
+    }
+
+where V(name) is an input variable or an earlier step. The same steps are
+- evaluated on scalars or NumPy columns (the answer_generator),
+- rendered as formula strings over the input variables (the formula_generator),
+- turned into a ComputationGraph, one edge per step.
+
+"/" is integer division, the templates' constraints keep it exact.
+"""
+
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+
+class Expr:
+    precedence = 3
+
+    def __add__(self, other):
+        return BinOp("+", self, _wrap(other))
+
+    def __radd__(self, other):
+        return BinOp("+", _wrap(other), self)
+
+    def __sub__(self, other):
+        return BinOp("-", self, _wrap(other))
+
+    def __rsub__(self, other):
+        return BinOp("-", _wrap(other), self)
+
+    def __mul__(self, other):
+        return BinOp("*", self, _wrap(other))
+
+    def __rmul__(self, other):
+        return BinOp("*", _wrap(other), self)
+
+    def __truediv__(self, other):
+        return BinOp("/", self, _wrap(other))
+
+    def __rtruediv__(self, other):
+        return BinOp("/", _wrap(other), self)
+
+
+class V(Expr):
+    """Input variable or earlier step, by name"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def evaluate(self, values):
+        return values[self.name]
+
+    def render(self, symbols):
+        return symbols[self.name]
+
+
+class Num(Expr):
+    """Literal number"""
+
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, values):
+        return self.value
+
+    def render(self, symbols):
+        return str(self.value)
+
+
+class BinOp(Expr):
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.precedence = PRECEDENCE[op]
+
+    def evaluate(self, values):
+        left = self.left.evaluate(values)
+        right = self.right.evaluate(values)
+        if self.op == "+":
+            return left + right
+        if self.op == "-":
+            return left - right
+        if self.op == "*":
+            return left * right
+        return left // right
+
+    def render(self, symbols):
+        left = self.left.render(symbols)
+        right = self.right.render(symbols)
+        if self.left.precedence < self.precedence:
+            left = f"({left})"
+        # a-(b-c), a-(b+c), a/(b*c) and a/(b/c) need parentheses, a+(b-c) and a*(b/c) do not
+        if self.right.precedence < self.precedence or (
+            self.right.precedence == self.precedence and self.op in "-/"
+        ):
+            right = f"({right})"
+        return f"{left}{self.op}{right}"
+
+    def operands(self):
+        """Operands of the chain of this operator, e.g. [a, b, c] for a+b+c"""
+        if isinstance(self.left, BinOp) and self.left.op == self.op:
+            return self.left.operands() + [self.right]
+        return [self.left, self.right]
+
+
+def _wrap(value):
+    return value if isinstance(value, Expr) else Num(value)
+
+
+def inline(expr, steps):
+    """Replace references to steps by their expressions, recursively"""
+    if isinstance(expr, V) and expr.name in steps:
+        return inline(steps[expr.name], steps)
+    if isinstance(expr, BinOp):
+        return BinOp(expr.op, inline(expr.left, steps), inline(expr.right, steps))
+    return expr
+
+
+def evaluate_steps(steps, variables):
+    """{step: value} for scalar or columnar variables, steps evaluated in order"""
+    values = dict(variables)
+    results = {}
+    for name, expr in steps.items():
+        values[name] = results[name] = expr.evaluate(values)
+    return results
+
+
+def render_steps(steps, symbols):
+    """{step: formula string over the input variables}"""
+    return {name: inline(expr, steps).render(symbols) for name, expr in steps.items()}
+
+
+def step_graph(steps, values, graph, meanings=None):
+    """
+    Add one edge per step to a ComputationGraph (nested sub-expressions get their own node).
+
+    Args:
+        values: variables and step results of one instance
+        meanings: {name: entity name} for the nodes, defaults to the variable / step names
+    """
+    meanings = meanings if meanings is not None else {}
+
+    def node(expr):
+        if isinstance(expr, Num):
+            value = str(expr.value)
+            graph.add_node(value, is_input=True)
+            return value
+        if isinstance(expr, V):
+            value = str(values[expr.name])
+            graph.add_node(value, is_input=expr.name not in steps, entity_name=meanings.get(expr.name, expr.name))
+            return value
+        value = str(expr.evaluate(values))
+        graph.add_node(value, is_input=False)
+        graph.add_edge([node(operand) for operand in expr.operands()], expr.op, value)
+        return value
+
+    for name, expr in steps.items():
+        target = str(values[name])
+        sources = [node(operand) for operand in expr.operands()] if isinstance(expr, BinOp) else [node(expr)]
+        graph.add_node(target, is_input=False, entity_name=meanings.get(name, name))
+        graph.add_edge(sources, expr.op if isinstance(expr, BinOp) else "=", target)
+    return graph
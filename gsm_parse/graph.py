@@ -0,0 +1,271 @@
+"""
+Compact computation graphs.
+
+A ComputationGraph numbers its nodes 0, 1, ... in insertion order and keeps them in
+parallel arrays (interned value strings, input flags, entity names). Edges are stored
+CSR-style: edge i goes from sources[source_offsets[i]:source_offsets[i + 1]] to node
+edge_targets[i] with operation edge_ops[i].
+
+GraphArena packs many graphs into one set of flat arrays (no per-graph Python objects),
+which is what keeps e.g. 1M parsed responses in memory; arena[i] rebuilds graph i.
+"""
+import sys
+from array import array
+from typing import Dict, Iterator, List, Tuple
+
+
+def intern(value: str) -> str:
+    return sys.intern(str(value))
+
+
+class Node:
+    """Represents a value in the computation graph"""
+
+    __slots__ = ("value", "is_input", "entity_name")
+
+    def __init__(self, value: str, is_input: bool = False, entity_name: str = ""):
+        self.value = value
+        self.is_input = is_input
+        self.entity_name = entity_name
+
+    def __repr__(self):
+        return f"Node(value={self.value!r}, is_input={self.is_input}, entity_name={self.entity_name!r})"
+
+    def __eq__(self, other):
+        return isinstance(other, Node) and (self.value, self.is_input, self.entity_name) == (
+            other.value, other.is_input, other.entity_name
+        )
+
+
+class ComputationGraph:
+    __slots__ = (
+        "values", "ids", "is_input", "entity_names",
+        "edge_targets", "edge_ops", "source_offsets", "sources",
+    )
+
+    def __init__(self):
+        self.values: List[str] = []  # node id -> value
+        self.ids: Dict[str, int] = {}  # value -> node id
+        self.is_input = bytearray()
+        self.entity_names: List[str] = []
+        self.edge_targets = array("i")
+        self.edge_ops: List[str] = []
+        self.source_offsets = array("i", [0])
+        self.sources = array("i")
+
+    def add_node(
+        self, value: str, is_input: bool = False, entity_name: str = ""
+    ) -> int:
+        """Add a node to the graph with optional entity name (no-op if it exists), returns its id"""
+        node_id = self.ids.get(value)
+        if node_id is None:
+            node_id = self.ids[value] = len(self.values)
+            self.values.append(intern(value))
+            self.is_input.append(is_input)
+            self.entity_names.append(intern(entity_name))
+        return node_id
+
+    def add_edge(self, sources: List[str], operation: str, target: str) -> None:
+        """Edge from all sources to target; values that are not nodes yet are added as nodes"""
+        self.edge_targets.append(self.add_node(target))
+        self.edge_ops.append(intern(operation))
+        self.sources.extend([self.add_node(source) for source in sources])
+        self.source_offsets.append(len(self.sources))
+
+    def set_entity_name(self, value: str, entity_name: str) -> None:
+        self.entity_names[self.ids[value]] = intern(entity_name)
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.values)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.edge_targets)
+
+    def edge_sources(self, edge: int) -> List[int]:
+        return self.sources[self.source_offsets[edge]: self.source_offsets[edge + 1]].tolist()
+
+    def iter_edges(self) -> Iterator[Tuple[List[str], str, str]]:
+        """(source values, operation, target value) for every edge, in insertion order"""
+        values = self.values
+        for edge, target in enumerate(self.edge_targets):
+            yield [values[i] for i in self.edge_sources(edge)], self.edge_ops[edge], values[target]
+
+    def get_parents(self, node_value: str) -> List[str]:
+        """Sources of all edges into node_value"""
+        node_id = self.ids[node_value]
+        values = self.values
+        return [
+            values[i]
+            for edge, target in enumerate(self.edge_targets)
+            if target == node_id
+            for i in self.edge_sources(edge)
+        ]
+
+    # dict views in the format of the previous dict-based graph, built on access
+
+    @property
+    def nodes(self) -> Dict[str, Node]:
+        """value -> Node (copies, use set_entity_name to change a node)"""
+        return {
+            value: Node(value, bool(flag), entity_name)
+            for value, flag, entity_name in zip(self.values, self.is_input, self.entity_names)
+        }
+
+    @property
+    def edges(self) -> Dict[str, List[Tuple[List[str], str]]]:
+        """target -> [(sources, operation)], every node has an entry"""
+        edges = {value: [] for value in self.values}
+        for sources, operation, target in self.iter_edges():
+            edges[target].append((sources, operation))
+        return edges
+
+    def to_dict(self) -> Dict[str, list]:
+        """JSON-serializable arrays, inverse of from_dict"""
+        return {
+            "values": self.values,
+            "is_input": list(self.is_input),
+            "entity_names": self.entity_names,
+            "edge_targets": self.edge_targets.tolist(),
+            "edge_ops": self.edge_ops,
+            "source_offsets": self.source_offsets.tolist(),
+            "sources": self.sources.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, list]) -> "ComputationGraph":
+        graph = cls()
+        for value, flag, entity_name in zip(data["values"], data["is_input"], data["entity_names"]):
+            graph.add_node(value, bool(flag), entity_name)
+        graph.edge_targets.extend(data["edge_targets"])
+        graph.edge_ops.extend(intern(op) for op in data["edge_ops"])
+        graph.source_offsets = array("i", data["source_offsets"])
+        graph.sources.extend(data["sources"])
+        return graph
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+class GraphArena:
+    """
+    Many graphs in shared flat arrays.
+
+    Node and edge ids are global; graph g owns nodes node_offsets[g]:node_offsets[g + 1]
+    and edges edge_offsets[g]:edge_offsets[g + 1]. Values, operations and entity names
+    are ids into one string table.
+    """
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.string_ids: Dict[str, int] = {}
+        self.node_offsets = array("q", [0])
+        self.node_values = array("i")
+        self.node_entities = array("i")
+        self.node_is_input = bytearray()
+        self.edge_offsets = array("q", [0])
+        self.edge_targets = array("i")  # local node id within the graph
+        self.edge_ops = array("i")
+        self.source_offsets = array("q", [0])
+        self.sources = array("i")  # local node ids
+
+    def __len__(self):
+        return len(self.node_offsets) - 1
+
+    def string_id(self, value: str) -> int:
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = self.string_ids[value] = len(self.strings)
+            self.strings.append(value)
+        return string_id
+
+    def add(self, graph: ComputationGraph) -> int:
+        """Append a graph, returns its index"""
+        string_id = self.string_id
+        self.node_values.extend([string_id(value) for value in graph.values])
+        self.node_entities.extend([string_id(name) for name in graph.entity_names])
+        self.node_is_input += graph.is_input
+        self.node_offsets.append(len(self.node_values))
+
+        offset = self.source_offsets[-1]
+        self.edge_targets.extend(graph.edge_targets)
+        self.edge_ops.extend([string_id(op) for op in graph.edge_ops])
+        self.sources.extend(graph.sources)
+        self.source_offsets.extend([offset + end for end in graph.source_offsets[1:]])
+        self.edge_offsets.append(len(self.edge_targets))
+        return len(self) - 1
+
+    def extend(self, graphs) -> None:
+        for graph in graphs:
+            self.add(graph)
+
+    def add_texts(self, answer_texts) -> None:
+        """
+        Parse answers straight into the arena, without building a ComputationGraph per
+        answer; arena[i] equals parse_computation_graph(answer_texts[i]).
+        """
+        from .calc_parser import calculation_plans
+
+        string_id = self.string_id
+        empty = string_id("")
+        for answer_text in answer_texts:
+            local = {}
+            for plan in calculation_plans(answer_text):
+                for step in plan:
+                    if step[0] == "input":
+                        if step[1] not in local:
+                            local[step[1]] = len(local)
+                            self.node_values.append(string_id(step[1]))
+                            self.node_is_input.append(1)
+                            self.node_entities.append(empty)
+                        continue
+                    _, sources, operation, target = step
+                    for value in (target,) + sources:
+                        if value not in local:
+                            local[value] = len(local)
+                            self.node_values.append(string_id(value))
+                            self.node_is_input.append(0)
+                            self.node_entities.append(empty)
+                    self.edge_targets.append(local[target])
+                    self.edge_ops.append(string_id(operation))
+                    self.sources.extend([local[value] for value in sources])
+                    self.source_offsets.append(len(self.sources))
+            self.node_offsets.append(len(self.node_values))
+            self.edge_offsets.append(len(self.edge_targets))
+
+    def __getitem__(self, index: int) -> ComputationGraph:
+        if index < 0:
+            index += len(self)
+        strings = self.strings
+        graph = ComputationGraph()
+        node_start, node_end = self.node_offsets[index], self.node_offsets[index + 1]
+        for value, entity, flag in zip(
+            self.node_values[node_start:node_end],
+            self.node_entities[node_start:node_end],
+            self.node_is_input[node_start:node_end],
+        ):
+            graph.add_node(strings[value], bool(flag), strings[entity])
+        edge_start, edge_end = self.edge_offsets[index], self.edge_offsets[index + 1]
+        base = self.source_offsets[edge_start]
+        graph.edge_targets.extend(self.edge_targets[edge_start:edge_end])
+        graph.edge_ops.extend([strings[op] for op in self.edge_ops[edge_start:edge_end]])
+        graph.sources.extend(self.sources[base: self.source_offsets[edge_end]])
+        graph.source_offsets.extend([end - base for end in self.source_offsets[edge_start + 1: edge_end + 1]])
+        return graph
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def nbytes(self) -> int:
+        """Size of the arrays (the string table excluded)"""
+        arrays = [
+            self.node_offsets, self.node_values, self.node_entities, self.edge_offsets,
+            self.edge_targets, self.edge_ops, self.source_offsets, self.sources,
+        ]
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.node_is_input)
@@ -0,0 +1,144 @@
+"""
+Shape statistics of computation graphs.
+
+analyze walks a ComputationGraph once in topological order (Kahn's algorithm over the CSR
+edge arrays): a node's level is 0 for a root (no incoming edge) and otherwise one more than
+the deepest source of its incoming edges, memoized per node, so depth, width and the
+critical path come out of the same pass. A step that uses its own result (<<5*1=5>>) does
+not count as a dependency; nodes left on a longer cycle are appended to the order unleveled.
+
+graph_features / feature_matrix turn the statistics into fixed-length vectors (columns in
+FEATURES) for analysing difficulty over whole result sets.
+"""
+from collections import Counter
+
+# numpy is imported by the feature functions, gsm_parser imports this module for final_node
+
+FEATURES = [
+    "num_nodes", "num_edges", "num_roots", "num_sinks",
+    "depth", "width", "max_fan_in", "mean_fan_in", "num_cyclic",
+]
+
+
+def analyze(graph):
+    """
+    Returns:
+        {"order": node ids in topological order, "levels": level per node id,
+         "roots", "sinks": node values, "final": value of the deepest sink (None if empty),
+         "depth": longest chain of steps, "width": most nodes on one level,
+         "critical_path": values from a root to the final node,
+         "fan_in": number of sources per edge, "cyclic": node values on a cycle}
+    """
+    num_nodes = graph.num_nodes
+    targets, offsets, sources = graph.edge_targets, graph.source_offsets, graph.sources
+    edge_sources = []
+    users = [[] for _ in range(num_nodes)]  # edges that wait for the node
+    waiting = [0] * num_nodes  # incoming edges not resolved yet
+    incoming = [0] * num_nodes
+    pending = []  # sources of the edge not placed yet
+    for edge, target in enumerate(targets):
+        own = sources[offsets[edge]: offsets[edge + 1]]
+        edge_sources.append(own)
+        distinct = set(own)
+        distinct.discard(target)
+        pending.append(len(distinct))
+        for source in distinct:
+            users[source].append(edge)
+        incoming[target] += 1
+        waiting[target] += 1
+
+    levels = [0] * num_nodes
+    parent = [-1] * num_nodes
+    placed = [False] * num_nodes
+
+    def resolve(edge):
+        target = targets[edge]
+        best = -1
+        for source in edge_sources[edge]:
+            if source != target and (best < 0 or levels[source] > levels[best]):
+                best = source
+        level = levels[best] + 1 if best >= 0 else 1
+        if level > levels[target]:
+            levels[target], parent[target] = level, best
+        waiting[target] -= 1
+        return waiting[target] == 0
+
+    order = [node for node in range(num_nodes) if waiting[node] == 0]
+    # edges whose only source is their own target are resolved up front
+    for edge, count in enumerate(pending):
+        if count == 0 and resolve(edge):
+            order.append(targets[edge])
+    for node in order:
+        placed[node] = True
+    head = 0
+    while head < len(order):
+        node = order[head]
+        head += 1
+        for edge in users[node]:
+            pending[edge] -= 1
+            if pending[edge] == 0 and resolve(edge):
+                order.append(targets[edge])
+                placed[targets[edge]] = True
+    cyclic = [node for node in range(num_nodes) if not placed[node]]
+    order.extend(cyclic)
+
+    values = graph.values
+    sinks = [node for node in range(num_nodes) if not users[node]]
+    final = max(reversed(sinks), key=levels.__getitem__) if sinks else None
+
+    path = []
+    node = final if final is not None else -1
+    while node >= 0:
+        path.append(values[node])
+        node = parent[node]
+
+    placed_levels = [levels[node] for node in range(num_nodes) if placed[node]]
+    return {
+        "order": order,
+        "levels": levels,
+        "roots": [values[node] for node in range(num_nodes) if incoming[node] == 0],
+        "sinks": [values[node] for node in sinks],
+        "final": values[final] if final is not None else None,
+        "depth": max(placed_levels, default=0),
+        "width": max(Counter(placed_levels).values(), default=0),
+        "critical_path": path[::-1],
+        "fan_in": [len(own) for own in edge_sources],
+        "cyclic": [values[node] for node in cyclic],
+    }
+
+
+def topological_order(graph):
+    """Node values, every node after the sources of its incoming edges"""
+    return [graph.values[node] for node in analyze(graph)["order"]]
+
+
+def final_node(graph):
+    """Value of the final result: the deepest node that feeds no other step"""
+    return analyze(graph)["final"]
+
+
+def graph_features(graph, stats=None):
+    """float64 vector with one entry per FEATURES column"""
+    import numpy as np
+
+    stats = stats if stats is not None else analyze(graph)
+    fan_in = stats["fan_in"]
+    return np.array([
+        graph.num_nodes,
+        graph.num_edges,
+        len(stats["roots"]),
+        len(stats["sinks"]),
+        stats["depth"],
+        stats["width"],
+        max(fan_in, default=0),
+        sum(fan_in) / len(fan_in) if fan_in else 0.0,
+        len(stats["cyclic"]),
+    ], dtype=np.float64)
+
+
+def feature_matrix(graphs):
+    """(n, len(FEATURES)) features of many graphs (a list, a GraphArena, ...)"""
+    import numpy as np
+
+    rows = [graph_features(graph) for graph in graphs]
+    return np.array(rows, dtype=np.float64).reshape(-1, len(FEATURES))
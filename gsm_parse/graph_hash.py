@@ -0,0 +1,119 @@
+"""
+Canonical hashing of computation graphs.
+
+The hash of a computed node is a Merkle hash over its incoming edges: the operation and
+the hashes of the sources, sorted for the commutative operations + and *, so a*b and b*a
+(or the order in which the steps were written) give the same hash. The graph hash
+combines the sorted hashes of its sinks (nodes that feed nothing).
+
+With values=True the numbers are part of the hash (the graph equals the ground truth);
+with values=False only the shape and the operations are (same reasoning structure).
+"""
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+
+COMMUTATIVE = {"+", "*"}
+
+
+def _h(*parts):
+    h = hashlib.blake2b(digest_size=8)
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.digest()
+
+
+def node_hashes(graph, values=True):
+    """{node value: 8-byte hash}"""
+    incoming = defaultdict(list)
+    for sources, op, target in graph.iter_edges():
+        incoming[target].append((op, sources))
+
+    hashes = {}
+    on_stack = set()
+
+    def visit(value):
+        if value in hashes:
+            return hashes[value]
+        if value in on_stack:
+            # a step that uses its own result, e.g. <<5*1=5>>
+            return _h("cycle", value if values else "")
+        on_stack.add(value)
+        edges = []
+        for op, sources in incoming[value]:
+            children = [visit(source) for source in sources]
+            if op in COMMUTATIVE:
+                children.sort()
+            edges.append(_h(op, *children))
+        on_stack.discard(value)
+        label = value if values else ""
+        if edges:
+            hashes[value] = _h("node", label, *sorted(edges))
+        else:
+            hashes[value] = _h("leaf", label)
+        return hashes[value]
+
+    for value in graph.values:
+        visit(value)
+    return hashes
+
+
+def graph_hash(graph, values=True):
+    """Canonical 64-bit hash of a ComputationGraph (0 for a graph without edges)"""
+    if graph.num_edges == 0:
+        return 0
+    hashes = node_hashes(graph, values)
+    used = set()
+    for sources, _, _ in graph.iter_edges():
+        used.update(sources)
+    sinks = sorted(hashes[value] for value in graph.values if value not in used)
+    return int.from_bytes(_h("graph", *sinks), "little")
+
+
+def graph_hashes(graphs, values=True):
+    """uint64 array of graph_hash for many graphs"""
+    return np.fromiter((graph_hash(graph, values) for graph in graphs), dtype=np.uint64)
+
+
+class GraphHashIndex:
+    """hash -> ids of the examples whose graph has that hash"""
+
+    def __init__(self):
+        self.index = defaultdict(list)
+
+    def add(self, hash_value, example_id):
+        self.index[int(hash_value)].append(example_id)
+
+    def extend(self, hashes, example_ids):
+        for hash_value, example_id in zip(hashes, example_ids):
+            self.add(hash_value, example_id)
+
+    def lookup(self, hash_value):
+        return self.index.get(int(hash_value), [])
+
+    def __len__(self):
+        return len(self.index)
+
+    def groups(self, min_size=2):
+        """Sets of examples sharing one structure, largest first"""
+        groups = [ids for ids in self.index.values() if len(ids) >= min_size]
+        return sorted(groups, key=len, reverse=True)
+
+
+def match_rates(matches, keys):
+    """
+    Mean of a boolean array per distinct key, in one pass.
+
+    Args:
+        matches: bool array (n,)
+        keys: array (n,) of group labels
+
+    Returns:
+        {key: rate}
+    """
+    labels, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    totals = np.bincount(inverse, minlength=len(labels))
+    hits = np.bincount(inverse, weights=np.asarray(matches, dtype=np.float64), minlength=len(labels))
+    return {label.item(): hit / total for label, hit, total in zip(labels, hits, totals)}
@@ -0,0 +1,145 @@
+"""
+Batched rendering of computation graphs.
+
+graph_to_dot builds the DOT text directly (no graphviz Python package needed). A
+GraphRenderer collects (graph, output_file) requests and renders them on flush():
+
+- format "dot": only the DOT text is written, no graphviz process at all
+- otherwise every distinct graph (by hash of its DOT text) is rendered once into
+  cache_dir, by one `dot -O` call per chunk of files (chunks run in parallel with
+  workers > 1), and copied to output_file.<format>
+
+Most ground-truth wordings share one graph, so they cost a single render; the cache is
+kept on disk, so it also carries over between runs and processes. `dot` writes into a
+private directory next to the cache and finished files are moved in with os.replace, so
+a process never copies a cache entry another one is still writing.
+"""
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+
+DOT_CHUNK = 256
+
+
+def _quote(text):
+    return '"' + str(text).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def graph_to_dot(graph, comment="Computation Graph"):
+    """DOT text of a ComputationGraph, same layout as the former graphviz rendering"""
+    lines = [f"// {comment}", "digraph {", "\trankdir=BT"]
+    for value, is_input in zip(graph.values, graph.is_input):
+        shape = "box" if is_input else "ellipse"
+        lines.append(f"\t{_quote(value)} [label={_quote(value)} shape={shape}]")
+    for edge, (sources, op, target) in enumerate(graph.iter_edges()):
+        # one small node per operation, labelled with the operator
+        op_node = _quote(f"op{edge}_{op}")
+        lines.append(f"\t{op_node} [label={_quote(op)} fillcolor=lightgray shape=circle style=filled]")
+        for source in sources:
+            lines.append(f"\t{_quote(source)} -> {op_node}")
+        lines.append(f"\t{op_node} -> {_quote(target)}")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def dot_hash(dot_text):
+    return hashlib.sha1(dot_text.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+
+def _run_dot(paths, fmt):
+    """One graphviz process for many .dot files, writes <path>.<fmt> next to each"""
+    subprocess.run(["dot", f"-T{fmt}", "-O", *paths], check=True)
+
+
+class GraphRenderer:
+    def __init__(self, format="png", cache_dir="out/graph_cache", workers=1):
+        self.format = format
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.pending = []  # (dot_text, output_file)
+        # rendered counts graphviz renders, requested - rendered were served from the cache
+        self.stats = {"requested": 0, "rendered": 0}
+
+    def add(self, graph, output_file):
+        """Queue graph for output_file (without extension, like graphviz's render)"""
+        self.add_dot(graph_to_dot(graph), output_file)
+
+    def add_dot(self, dot_text, output_file):
+        """Queue DOT text, e.g. the `pending` jobs a renderer in a worker process collected"""
+        self.pending.append((dot_text, output_file))
+        self.stats["requested"] += 1
+
+    def flush(self):
+        """Render everything queued since the last flush"""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        for dot_text, output_file in pending:
+            os.makedirs(os.path.dirname(output_file) or ".", exist_ok=True)
+            _write_atomic(output_file, dot_text)
+        if self.format == "dot":
+            return
+        if shutil.which("dot") is None:
+            print("graphviz `dot` not found, only the DOT text was written")
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        images = {}
+        missing = []
+        for dot_text, _ in pending:
+            key = dot_hash(dot_text)
+            if key in images:
+                continue
+            images[key] = os.path.join(self.cache_dir, f"{key}.dot.{self.format}")
+            if not os.path.exists(images[key]):
+                missing.append((key, dot_text))
+        self.stats["rendered"] += len(missing)
+        if missing:
+            self._render(missing)
+
+        for dot_text, output_file in pending:
+            shutil.copyfile(images[dot_hash(dot_text)], f"{output_file}.{self.format}")
+
+    def _render(self, missing):
+        """Render (key, dot_text) pairs in a private directory, then move them into the cache"""
+        # same file system as the cache, so os.replace is an atomic rename
+        work_dir = tempfile.mkdtemp(prefix=".render-", dir=self.cache_dir)
+        try:
+            dot_paths = []
+            for key, dot_text in missing:
+                dot_paths.append(os.path.join(work_dir, f"{key}.dot"))
+                with open(dot_paths[-1], "w") as file:
+                    file.write(dot_text)
+
+            chunks = [dot_paths[i: i + DOT_CHUNK] for i in range(0, len(dot_paths), DOT_CHUNK)]
+            if self.workers > 1 and len(chunks) > 1:
+                from concurrent.futures import ThreadPoolExecutor
+
+                with ThreadPoolExecutor(self.workers) as pool:
+                    list(pool.map(lambda chunk: _run_dot(chunk, self.format), chunks))
+            else:
+                for chunk in chunks:
+                    _run_dot(chunk, self.format)
+
+            for (key, _), dot_path in zip(missing, dot_paths):
+                os.replace(dot_path, os.path.join(self.cache_dir, f"{key}.dot"))
+                # the image last: once it exists, the entry is complete
+                os.replace(f"{dot_path}.{self.format}", os.path.join(self.cache_dir, f"{key}.dot.{self.format}"))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if exc[0] is None:
+            self.flush()
@@ -0,0 +1,146 @@
+"""
+Parsed computation graphs on disk.
+
+A store is a JSONL file with one graph per line ({"model_id", "sample_id", "graph":
+ComputationGraph.to_dict()}) and an index file next to it with the byte offset of every
+line. Opening a store only reads the index; store[(model_id, sample_id)] seeks to the line
+and decodes that one graph, so analyses can read any graph without re-parsing responses.
+
+A store is written once per results file and rebuilt when the results file changes
+(size or modification time differ from the ones recorded in the index) or was written by
+another STORE_VERSION. Both files are written to a temporary file and renamed into place,
+the index last and only after the old one is removed, so a crash never leaves an index
+next to data it does not describe.
+"""
+import json
+import os
+
+from .gsm_parser import parse_computation_graphs
+from .graph import ComputationGraph
+
+STORE_DIR = "out/graph_store"
+# bump when the parser changes the graphs of the same text, older stores are rebuilt
+STORE_VERSION = 2
+
+
+def _source_stamp(source_path):
+    stat = os.stat(source_path)
+    return {"source": source_path, "source_size": stat.st_size, "source_mtime": stat.st_mtime}
+
+
+def _replace_with(path, write):
+    """write(file) into a temporary file, then rename it to path"""
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+class GraphStore:
+    """Read-only, lazily loaded view of a store written by `write`"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}.index.json", "r") as f:
+            index = json.load(f)
+        self.meta = {key: value for key, value in index.items() if key not in ("keys", "offsets")}
+        self.offsets = {(model_id, sample_id): offset for (model_id, sample_id), offset in zip(index["keys"], index["offsets"])}
+        self._file = None
+
+    @classmethod
+    def write(cls, path, model_id, sample_ids, answer_texts, source_path=None, workers=None):
+        """Parse answer_texts and write them as the graphs of (model_id, sample_id)"""
+        graphs = parse_computation_graphs(answer_texts, workers=workers)
+        keys, offsets = [], []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        def write_graphs(f):
+            for sample_id, graph in zip(sample_ids, graphs):
+                keys.append((model_id, sample_id))
+                offsets.append(f.tell())
+                record = {"model_id": model_id, "sample_id": sample_id, "graph": graph.to_dict()}
+                f.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        index_path = f"{path}.index.json"
+        # without an index the store is rebuilt, with the old one it would read the new data wrongly
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        _replace_with(path, write_graphs)
+        index = {
+            **(_source_stamp(source_path) if source_path else {}),
+            "version": STORE_VERSION, "keys": keys, "offsets": offsets,
+        }
+        _replace_with(index_path, lambda f: f.write(json.dumps(index).encode("utf-8")))
+        return cls(path)
+
+    def is_stale(self, source_path):
+        """Whether source_path changed (or the store format did) since the store was written from it"""
+        if self.meta.get("version") != STORE_VERSION:
+            return True
+        return any(self.meta.get(key) != value for key, value in _source_stamp(source_path).items())
+
+    def record(self, key):
+        """Raw record {"model_id", "sample_id", "graph"} of key"""
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        self._file.seek(self.offsets[key])
+        return json.loads(self._file.readline())
+
+    def __getitem__(self, key) -> ComputationGraph:
+        return ComputationGraph.from_dict(self.record(key)["graph"])
+
+    def get(self, key, default=None):
+        return self[key] if key in self.offsets else default
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def keys(self):
+        return list(self.offsets)
+
+    def items(self):
+        """(key, graph) for every graph, read sequentially"""
+        with open(self.path, "rb") as f:
+            for line in f:
+                record = json.loads(line)
+                yield (record["model_id"], record["sample_id"]), ComputationGraph.from_dict(record["graph"])
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def store_path(source_path, store_dir=STORE_DIR):
+    name = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(store_dir, f"{name}.graphs.jsonl")
+
+
+def open_store(source_path, model_id, text_key="response", store_dir=STORE_DIR, workers=None):
+    """
+    Store of the graphs of a results file (or of the deductions of a questions file with
+    text_key="deduction"), parsed and written on first use or when the file changed.
+    """
+    path = store_path(source_path, store_dir)
+    if os.path.exists(path) and os.path.exists(f"{path}.index.json"):
+        store = GraphStore(path)
+        if not store.is_stale(source_path):
+            return store
+        store.close()
+    with open(source_path, "r") as f:
+        items = json.load(f)
+    return GraphStore.write(
+        path, model_id,
+        [item["sample_id"] for item in items],
+        [item.get(text_key, "") for item in items],
+        source_path=source_path, workers=workers,
+    )
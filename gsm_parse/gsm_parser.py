@@ -1,42 +1,11 @@
-from dataclasses import dataclass
 from typing import Dict, Set, List, Any
-import re
+from .calc_parser import calculation_plans
+from .graph import ComputationGraph, GraphArena, Node
+from .graph_analytics import final_node
+from .graph_render import GraphRenderer
 from .template_v2 import TaskTemplate
-from pdb import set_trace as pds
-from pprint import pprint as pp
 from typing import Dict, Any, Optional
 
-@dataclass
-class Node:
-    """Represents a value in the computation graph"""
-
-    value: str
-    is_input: bool = False
-    entity_name: str = ""
-
-
-class ComputationGraph:
-    def __init__(self):
-        self.nodes: Dict[str, Node] = {}  # value -> Node
-        self.edges: Dict[str, List[tuple[str, str, str]]] = (
-            {}
-        )  # target -> [(source1, source2, operation)]
-
-    def add_node(
-        self, value: str, is_input: bool = False, entity_name: str = ""
-    ) -> None:
-        """Add a node to the graph with optional entity name"""
-        if value not in self.nodes:
-            self.nodes[value] = Node(value, is_input, entity_name)
-            self.edges[value] = []
-
-    def add_edge(self, sources: list[str], operation: str, target: str) -> None:
-        self.edges[target].append((sources, operation))
-
-    def get_parents(self, node_value: str) -> List[str]:
-        return [src[0] for src, _ in self.edges[node_value]]
-
-
 def parse_computation_graph(
     answer_text: str, 
     template: Optional[TaskTemplate] = None, 
@@ -46,6 +15,9 @@ def parse_computation_graph(
     Parse answer text into a computation graph where:
     - Nodes are numbers (both input values and computed results)
     - Edges represent operations between nodes
+
+    Each <<expression=result>> is parsed with operator precedence (see calc_parser); a
+    chain of one operator is one edge, mixed operators add a node per intermediate result.
     """
     graph = ComputationGraph()
 
@@ -54,44 +26,41 @@ def parse_computation_graph(
     else:
         variable_meanings = {}
 
-    # Find all calculations in <<...>> format
-    calc_pattern = r"<<(.*?)=(.*?)>>"
-    calculations = re.findall(calc_pattern, answer_text)
-
-    for expression, result in calculations:
-        result = result.strip()
-        expression = expression.strip()
-
-        # Parse the expression (general case: num1 operator num2 operator num3 ...)
-        # This regex captures numbers and operators
-        parts_pattern = r"(\d+|\+|\-|\*|\/)"
-        parts = re.findall(parts_pattern, expression)
-
-        if parts:
-            # Separate numbers and operators
-            numbers = [part for part in parts if part.isdigit()]
-            operators = [part for part in parts if not part.isdigit()]
-
-
-            # Add all numbers as nodes
-            for num in numbers:
+    for plan in calculation_plans(answer_text):
+        for step in plan:
+            if step[0] == "input":
                 graph.add_node(
-                    num, is_input=True, entity_name=variable_meanings.get(num, "")
+                    step[1], is_input=True, entity_name=variable_meanings.get(step[1], "")
                 )
+                continue
+            _, sources, operation, target = step
             graph.add_node(
-                result, is_input=False, entity_name=variable_meanings.get(result, "")
+                target, is_input=False, entity_name=variable_meanings.get(target, "")
             )
+            graph.add_edge(list(sources), operation, target)
 
-            # Add the computation edge (link all numbers to the result)
-            if len(operators) > 1:
-                if operators[0] != operators[1]:
-                    print(f"multiple Operators mismatch: {operators}")
-                    assert False
-                # If there's only one operator, link directly
-            graph.add_edge(numbers, operators[0], result)
+    return graph
 
 
-    return graph
+def _parse_one(answer_text: str) -> ComputationGraph:
+    return parse_computation_graph(answer_text)
+
+
+def parse_computation_graphs(
+    answer_texts: List[str], workers: Optional[int] = None, chunksize: int = 256
+) -> List[ComputationGraph]:
+    """
+    Parse many answers (e.g. all model responses of a results file), in order.
+
+    Args:
+        workers: parse in a process pool of this size, in this process if None
+    """
+    if workers is None or workers <= 1:
+        return [parse_computation_graph(answer_text) for answer_text in answer_texts]
+    from multiprocessing import Pool
+
+    with Pool(workers) as pool:
+        return pool.map(_parse_one, answer_texts, chunksize=chunksize)
 
 
 def visualize_graph(graph: ComputationGraph) -> None:
@@ -103,9 +72,8 @@ def visualize_graph(graph: ComputationGraph) -> None:
         print(f"  {value} ({node_type})")
 
     print("\nEdges (Computations):")
-    for target, edges in graph.edges.items():
-        for src1, src2, op in edges:
-            print(f"  {src1} {op} {src2} = {target}")
+    for sources, op, target in graph.iter_edges():
+        print(f"  {f' {op} '.join(sources)} = {target}")
 
     print("\nDependency Chain:")
     for target, edges in graph.edges.items():
@@ -115,116 +83,65 @@ def visualize_graph(graph: ComputationGraph) -> None:
 
 
 def visualize_graph_graphviz(
-    graph: ComputationGraph, output_file: str = "computation_graph"
+    graph: ComputationGraph, output_file: str = "computation_graph", format: str = "png"
 ) -> None:
     """
     Visualize the computation graph using graphviz
     Args:
         graph: ComputationGraph object
-        output_file: Name of the output file (without extension)
-    """
-    try:
-        from graphviz import Digraph
-    except ImportError:
-        print("Please install graphviz: pip install graphviz")
-        return
-
-    dot = Digraph(comment="Computation Graph")
-    dot.attr(rankdir="BT")  # Bottom to top layout
+        output_file: Name of the output file (without extension), the DOT text is saved there
+        format: image format, or "dot" for the DOT text only
 
-    # Add nodes
-    for value, node in graph.nodes.items():
-        shape = "box" if node.is_input else "ellipse"
-        dot.node(value, value, shape=shape)
-
-    # Add edges with operation labels
-    for target, edges in graph.edges.items():
-        for sources, op in edges:
-            # Create an invisible operation node to show the operator
-            op_node = f"{sources[0]}_{op}_{sources[1]}"
-            dot.node(op_node, op, shape="circle", style="filled", fillcolor="lightgray")
-
-            # Connect source nodes to operation node
-            for src in sources:
-                dot.edge(src, op_node)
-            # Connect operation node to target
-            dot.edge(op_node, target)
-
-    # Save the graph without viewing
-    dot.render(output_file, view=False, format="png")
+    To render many graphs, queue them on one GraphRenderer (see graph_render) instead.
+    """
+    with GraphRenderer(format=format) as renderer:
+        renderer.add(graph, output_file)
 
 
 def extract_variable_meanings(template, variables):
     """
-    Extract semantic meanings for variables from the template structure
-
-    For Butcher Sales example:
-    - rate: "hourly meat sales rate"
-    - hours: "working hours per day"
-    - daily: "daily meat sales"
-    - weight: "total meat weight"
-    - days: "days needed to sell"
+    {value: entity name} for the nodes of a graph of this template instance, derived from
+    the variable and step names (see TaskTemplate.value_meanings), e.g. for Tree Logging
+    Calculation "340": "total oak", "68": "oak logs".
     """
-    meanings = {}
-
-    # Map variables to their semantic meanings based on template context
-    if template.type_name == "Butcher Sales":
-        meanings = {
-            str(variables["rate"]): "hourly meat sales rate",
-            str(variables["hours"]): "working hours per day",
-            str(variables["daily"]): "daily meat sales",
-            str(variables["weight"]): "total meat weight",
-            str(variables["days"]): "days needed to sell",
-        }
-
-    return meanings
+    return template.value_meanings(variables)
 
 
 def print_ascii_tree(graph: ComputationGraph) -> None:
     """
-    Print an ASCII representation of the computation graph
+    Print an ASCII representation of the computation graph, from the final result down
     """
+    nodes = graph.nodes
+    edges = graph.edges
 
-    def find_final_result():
-        # Find nodes that are not used as inputs in any calculation
-        all_sources = set()
-        for edges in graph.edges.values():
-            for src1, src2, _ in edges:
-                all_sources.add(src1)
-                all_sources.add(src2)
-
-        final_results = set(graph.nodes.keys()) - all_sources
-        return list(final_results)[0] if final_results else None
-
-    def print_node_recursive(node_value: str, depth: int = 0, visited=None):
-        if visited is None:
-            visited = set()
-
+    def print_node_recursive(node_value: str, prefix: str = "", visited=None):
         if node_value in visited:
             return
         visited.add(node_value)
 
-        # Print current node
-        prefix = "    " * depth
-        node_type = "(INPUT)" if graph.nodes[node_value].is_input else "(COMPUTED)"
-        print(f"{prefix}{node_value} {node_type}")
-
         # Print operations and child nodes
-        for src1, src2, op in graph.edges[node_value]:
+        for sources, op in edges[node_value]:
             print(f"{prefix}├── {op} operation")
-            print(f"{prefix}│   ├── {src1}")
-            print(f"{prefix}│   └── {src2}")
+            for i, source in enumerate(sources):
+                last = i == len(sources) - 1
+                node_type = "(INPUT)" if nodes[source].is_input else "(COMPUTED)"
+                print(f"{prefix}│   {'└──' if last else '├──'} {source} {node_type}")
+                print_node_recursive(source, prefix + "│   " + ("    " if last else "│   "), visited)
 
     # Start from the final result
-    final_result = find_final_result()
+    final_result = final_node(graph)
     if final_result:
         print("Computation Tree (top-down):")
-        print_node_recursive(final_result)
+        node_type = "(INPUT)" if nodes[final_result].is_input else "(COMPUTED)"
+        print(f"{final_result} {node_type}")
+        print_node_recursive(final_result, "", set())
 
 def main():
     # Example usage
     from template_v2 import task_templates
     import random
+    from pdb import set_trace as pds
+    from pprint import pprint as pp
 
     index = random.randint(0, len(task_templates) - 1)
     index = 0 ## zhuoy
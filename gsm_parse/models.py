@@ -5,8 +5,17 @@ from pdb import set_trace as pds
 
     
 class LlamaCompletion:
-    def __init__(self, model_name = "meta-llama/Llama-3.2-3B-Instruct"):
+    def __init__(self, model_name = "meta-llama/Llama-3.2-3B-Instruct", server_url = None):
+        """With server_url, completions run on a gsm_symbolic.inference_server instead of a local copy"""
         self.model_name = model_name
+        self.completion_tokens = 0
+        self.prompt_tokens = 0
+        self.client = None
+        if server_url is not None:
+            from gsm_symbolic.inference_client import InferenceClient
+            self.client = InferenceClient(server_url)
+            return
+
         self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
         # Before generation, set the pad token
         if self.tokenizer.pad_token_id is None:
@@ -15,8 +24,6 @@ class LlamaCompletion:
         self.model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch.float16)
         if torch.cuda.is_available():
             self.model = self.model.cuda()
-        self.completion_tokens = 0
-        self.prompt_tokens = 0
 
     def completions(self, question="user query",temperature=0.7, max_tokens=1000, n=1, stop=None):
 
@@ -25,6 +32,22 @@ class LlamaCompletion:
             {"role": "user", "content": question}
         ]       
 
+        if self.client is not None:
+            results = self.client.generate(
+                self.model_name, messages = [messages] * n, max_new_tokens = max_tokens,
+                stop = stop, add_generation_prompt = False,
+            )
+            outputs = [result["completion"].strip() for result in results]
+            self.prompt_tokens += results[-1]["prompt_tokens"]
+            self.completion_tokens += results[-1]["completion_tokens"]
+            return type('Response', (), {
+                'outputs': outputs,
+                'usage': type('Usage', (), {
+                    'completion_tokens': self.completion_tokens,
+                    'prompt_tokens': self.prompt_tokens
+                })
+            })
+
         # Format messages into a prompt
         prompt = ""
         prompt = self.tokenizer.apply_chat_template(messages, tokenize=False)
@@ -0,0 +1,105 @@
+"""
+Prefix-deduplicated prompt sets.
+
+Few-shot prompts are `prefix + suffix` where the prefix (the in-context examples) is
+shared by many items. A prompt set stores every distinct prefix once:
+
+    {
+        "format": "prompt_set",
+        "prefixes": {prefix_id: prefix_text},
+        "items": [{..., "prefix_id": prefix_id, "suffix": suffix_text}]
+    }
+
+load_prompt_set also reads the plain list format of out/question_variations_with_context.json,
+where every item carries its full "prompt".
+"""
+import hashlib
+import json
+from collections import defaultdict
+
+FORMAT = "prompt_set"
+
+
+def prefix_id(prefix):
+    return hashlib.sha1(prefix.encode("utf-8")).hexdigest()[:12]
+
+
+class PromptSet:
+    def __init__(self, prefixes=None, items=None):
+        self.prefixes = prefixes if prefixes is not None else {}
+        self.items = items if items is not None else []
+
+    def add(self, item, prefix, suffix):
+        """Add an item whose full prompt is prefix + suffix (item itself has no prompt key)"""
+        pid = prefix_id(prefix)
+        self.prefixes.setdefault(pid, prefix)
+        self.items.append(dict(item, prefix_id=pid, suffix=suffix))
+
+    def prompt(self, index):
+        item = self.items[index]
+        return self.prefixes[item["prefix_id"]] + item["suffix"]
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        """Item with its full "prompt", rebuilt on access"""
+        item = dict(self.items[index])
+        item["prompt"] = self.prefixes[item["prefix_id"]] + item["suffix"]
+        return item
+
+    def __iter__(self):
+        for index in range(len(self.items)):
+            yield self[index]
+
+    def prefix_groups(self):
+        """{prefix_id: [item indices]}, items in a group share the whole prefix"""
+        groups = defaultdict(list)
+        for index, item in enumerate(self.items):
+            groups[item["prefix_id"]].append(index)
+        return dict(groups)
+
+    def summary(self):
+        prefix_chars = sum(len(prefix) for prefix in self.prefixes.values())
+        suffix_chars = sum(len(item["suffix"]) for item in self.items)
+        full_chars = sum(
+            len(self.prefixes[item["prefix_id"]]) + len(item["suffix"]) for item in self.items
+        )
+        return {
+            "num_items": len(self.items),
+            "num_prefixes": len(self.prefixes),
+            "group_sizes": {pid: len(indices) for pid, indices in self.prefix_groups().items()},
+            "stored_chars": prefix_chars + suffix_chars,
+            "full_chars": full_chars,
+        }
+
+    def to_json(self):
+        return {"format": FORMAT, "prefixes": self.prefixes, "items": self.items}
+
+
+def from_full_prompts(items, suffix_key="question"):
+    """Build a PromptSet from items with a full "prompt" ending in item[suffix_key]"""
+    prompt_set = PromptSet()
+    for item in items:
+        item = dict(item)
+        prompt = item.pop("prompt")
+        suffix = item.get(suffix_key, "")
+        if not prompt.endswith(suffix):
+            suffix = ""
+        prompt_set.add(item, prompt[: len(prompt) - len(suffix)], suffix)
+    return prompt_set
+
+
+def save_prompt_set(prompt_set, file_path):
+    print(f"save to {file_path}, {len(prompt_set)} items, {len(prompt_set.prefixes)} prefixes")
+    with open(file_path, "w") as file:
+        json.dump(prompt_set.to_json(), file, indent=4, ensure_ascii=False)
+
+
+def load_prompt_set(file_path):
+    """Load a prompt set, or convert a plain list of items with full prompts"""
+    with open(file_path, "r") as file:
+        data = json.load(file)
+    if isinstance(data, dict) and data.get("format") == FORMAT:
+        return PromptSet(data["prefixes"], data["items"])
+    return from_full_prompts(data)
@@ -0,0 +1,69 @@
+"""
+Compiled renderer for the str.format templates in template_v2 / template_variation.
+
+A template is parsed once into literal / field pieces; rendering is then a single
+%-format per instance instead of re-parsing the template on every str.format call.
+"""
+from functools import lru_cache
+from string import Formatter
+
+
+class CompiledTemplate:
+    def __init__(self, template, replacements=None):
+        """
+        Args:
+            template: str.format template with plain {name} fields
+            replacements: {old: new} substitutions applied to the literal text only,
+                e.g. {"logs": "pieces"} for the wording variations
+        """
+        self.template = template
+        self.fields = []
+        pieces = []
+        for literal, field, format_spec, conversion in Formatter().parse(template):
+            for old, new in (replacements or {}).items():
+                literal = literal.replace(old, new)
+            pieces.append(literal.replace("%", "%%"))
+            if field is None:
+                continue
+            if format_spec or conversion or not field.isidentifier():
+                raise ValueError(f"unsupported field {{{field}}} in template")
+            self.fields.append(field)
+            pieces.append("%s")
+        self.fmt = "".join(pieces)
+
+    def render(self, variables):
+        """Render one instance from a dict, like template.format(**variables)"""
+        return self.fmt % tuple([variables[field] for field in self.fields])
+
+    def render_many(self, rows):
+        """Render a list of variable dicts"""
+        fmt, fields = self.fmt, self.fields
+        return [fmt % tuple([row[field] for field in fields]) for row in rows]
+
+    def render_columns(self, columns, n):
+        """
+        Render n instances from columnar variables.
+
+        Args:
+            columns: {name: list or NumPy array of length n}
+        """
+        if not self.fields:
+            return [self.fmt % ()] * n
+        values = [_as_list(columns[field]) for field in self.fields]
+        fmt = self.fmt
+        return [fmt % row for row in zip(*values)]
+
+
+def _as_list(column):
+    # NumPy scalars would format fine too, but tolist() is much faster to iterate
+    return column.tolist() if hasattr(column, "tolist") else column
+
+
+@lru_cache(maxsize=None)
+def _compile(template, replacements):
+    return CompiledTemplate(template, dict(replacements))
+
+
+def compile_template(template, replacements=None):
+    """Cached CompiledTemplate for (template, replacements)"""
+    return _compile(template, tuple(sorted((replacements or {}).items())))
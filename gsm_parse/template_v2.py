@@ -1,7 +1,16 @@
 import random
-import numpy as np
-from pdb import set_trace as pds
-from pprint import pprint as pp
+import re
+from functools import cached_property, lru_cache
+from .expression import BinOp, Num, V, evaluate_steps, render_steps, step_graph
+from .render import compile_template
+
+# numpy (and .rng_streams, which needs it) is imported where it is used, so that
+# importing the templates stays cheap for analysis-only entry points
+
+# numeric domains with at most this many combinations are enumerated and masked once
+ENUMERATE_LIMIT = 1 << 20
+# otherwise every instance redraws until valid, vectorized over the batch
+MAX_REJECTION_ROUNDS = 256
 
 SYMBOL_NAMES = [
     "$#",
@@ -108,50 +117,140 @@ SYMBOL_NUMBERS = [
     "%^"
 ]
 
+NAMES = [
+    "Alice",
+    "Bob",
+    "Charlie",
+    "Diana",
+    "Eve",
+    "Frank",
+    "Grace",
+    "Hank",
+    "Ivy",
+    "Jack",
+    "Karen",
+    "Leo",
+    "Maya",
+    "Noah",
+    "Olivia",
+    "Peter"
+]
+
+ITEMS = [
+    "apples",
+    "bananas",
+    "candies",
+    "oranges",
+    "pencils",
+    "erasers",
+    "notebooks",
+    "chocolates",
+    "books",
+    "toys",
+    "shirts",
+    "bottles",
+]
+
+
 def get_random_name(setting):
     if setting["name_format"] == "symbol":
         return random.choice(SYMBOL_NAMES)
-    return random.choice(
-        [
-            "Alice",
-            "Bob",
-            "Charlie",
-            "Diana",
-            "Eve",
-            "Frank",
-            "Grace",
-            "Hank",
-            "Ivy",
-            "Jack",
-            "Karen",
-            "Leo",
-            "Maya",
-            "Noah",
-            "Olivia",
-            "Peter"
-        ]
-    )
+    return random.choice(NAMES)
 
 
 def get_random_item(setting):
     if setting["item_format"] == "symbol":
         return random.choice(SYMBOL_ITEMS)
-    return random.choice(
-        [
-            "apples",
-            "bananas",
-            "candies",
-            "oranges",
-            "pencils",
-            "erasers",
-            "notebooks",
-            "chocolates",
-            "books",
-            "toys",
-            "shirts",
-            "bottles",
-        ]
-    )
+    return random.choice(ITEMS)
+
+
+class IntRange:
+    """Integer drawn uniformly from [low, high] (both inclusive, like random.randint)"""
+
+    is_numeric = True
+
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def support(self):
+        return list(range(self.low, self.high + 1))
+
+    def sample(self, setting):
+        return random.randint(self.low, self.high)
+
+    def sample_batch(self, setting, n, rng):
+        return rng.integers(self.low, self.high + 1, size=n)
+
+
+class Choice:
+    """Number drawn uniformly from a fixed list of values"""
+
+    is_numeric = True
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def support(self):
+        return self.values
+
+    def sample(self, setting):
+        return random.choice(self.values)
+
+    def sample_batch(self, setting, n, rng):
+        import numpy as np
+        return np.asarray(self.values)[rng.integers(0, len(self.values), size=n)]
+
+
+class Name:
+    """Person name, drawn from SYMBOL_NAMES in the symbol name_format"""
+
+    is_numeric = False
+
+    def pool(self, setting):
+        return SYMBOL_NAMES if setting["name_format"] == "symbol" else NAMES
+
+    def sample(self, setting):
+        return get_random_name(setting)
+
+    def sample_batch(self, setting, n, rng):
+        import numpy as np
+        pool = self.pool(setting)
+        return np.asarray(pool, dtype=object)[rng.integers(0, len(pool), size=n)]
+
+    def sample_distinct(self, setting, n, rng, k):
+        """k columns whose values differ within every row (sampling without replacement)"""
+        import numpy as np
+        # the symbol pools contain repeated strings
+        pool = np.asarray(list(dict.fromkeys(self.pool(setting))), dtype=object)
+        order = np.argsort(rng.random((n, len(pool))), axis=1)
+        return [pool[order[:, j]] for j in range(k)]
+
+
+class Item(Name):
+    """Item name, drawn from SYMBOL_ITEMS in the symbol item_format"""
+
+    def pool(self, setting):
+        return SYMBOL_ITEMS if setting["item_format"] == "symbol" else ITEMS
+
+    def sample(self, setting):
+        return get_random_item(setting)
+
+
+class Const:
+    """Fixed (non-numeric) value, e.g. a pronoun"""
+
+    is_numeric = False
+
+    def __init__(self, value):
+        self.value = value
+
+    def sample(self, setting):
+        return self.value
+
+    def sample_batch(self, setting, n, rng):
+        import numpy as np
+        return np.full(n, self.value, dtype=object)
 
 
 class TaskTemplate:
@@ -160,21 +259,219 @@ class TaskTemplate:
         type_name,
         question_template,
         deduction_template,
-        variable_generator,
-        answer_generator,
-        formula_generator
+        variables,
+        computation,
+        constraints=(),
+        distinct=(),
     ):
+        """
+        variables maps each template variable to its domain (IntRange, Choice, Name, Item, Const).
+        computation maps each intermediate / final answer to its expression (see .expression),
+        one step per <<...>> of the deduction, in order; answers, formulas and the
+        computation graph are all derived from it.
+
+        constraints are predicates on the variables and answers (scalars or NumPy columns), on
+        top of the default that every answer is non-negative; e.g. divisibility wherever the
+        computation divides. distinct lists groups of name / item variables that must differ.
+        """
         self.type_name = type_name
         self.question_template = question_template
         self.deduction_template = deduction_template
-        self.variable_generator = variable_generator
-        self.answer_generator = answer_generator
-        self.formula_generator = formula_generator
+        self.variables = variables
+        self.computation = computation
+        self.constraints = list(constraints)
+        self.distinct = [tuple(group) for group in distinct]
+        # the final answer is whatever field follows "#### " in the deduction
+        self.answer_field = re.search(r"#### \{(\w+)\}", deduction_template).group(1)
+
+    def answer_generator(self, variables):
+        """{step: value}, works both on a dict of scalars and on a dict of NumPy columns"""
+        return evaluate_steps(self.computation, variables)
+
+    def formula_generator(self, variables):
+        """{step: formula string}, given the symbol of every numeric variable"""
+        return render_steps(self.computation, variables)
+
+    @cached_property
+    def formula_renderers(self):
+        """{step: compiled formula}, with a {field} per numeric variable"""
+        fields = {key: "{" + key + "}" for key in self.variables}
+        return {key: compile_template(formula) for key, formula in self.formula_generator(fields).items()}
+
+    def computation_graph(self, variables):
+        """ComputationGraph of one instance with numeric variables, one edge per step"""
+        from .graph import ComputationGraph
+
+        values = dict(variables)
+        values.update(self.answer_generator(variables))
+        return step_graph(self.computation, values, ComputationGraph())
+
+    def entity_label(self, name, variables):
+        """Readable name of a variable or step, e.g. pine_logs -> "oak logs" when pine is oak"""
+        words = name.split("_")
+        return " ".join(
+            str(variables[word]) if word in self.variables and word in variables and not self.variables[word].is_numeric else word
+            for word in words
+        )
+
+    @cached_property
+    def _constants(self):
+        """Literal numbers of the computation, e.g. the 12 of a dozen"""
+        constants, stack = [], list(self.computation.values())
+        while stack:
+            expr = stack.pop()
+            if isinstance(expr, Num):
+                constants.append(str(expr.value))
+            elif isinstance(expr, BinOp):
+                stack.extend(expr.operands())
+        return constants
+
+    @cached_property
+    def _value_meanings(self):
+        @lru_cache(maxsize=4096)
+        def build(instance):
+            variables = dict(instance)
+            values = {key: variables[key] for key in self.numeric_variables()}
+            values.update(self.answer_generator(values))
+            meanings = {}
+            for name, value in values.items():
+                label = self.entity_label(name, variables)
+                value = str(value)
+                # several variables / steps with the same value share one node
+                meanings[value] = f"{meanings[value]} / {label}" if value in meanings else label
+            for value in self._constants:
+                meanings.setdefault(value, "constant")
+            return meanings
+
+        return build
+
+    def value_meanings(self, variables):
+        """
+        {value string: entity name} of one instance, for every numeric variable, step and
+        literal number of the computation.
+        Values shared by several of them map to all their names, joined by " / ".
+        Cached per instance; the returned dict is shared, do not modify it.
+        """
+        instance = tuple((key, variables[key]) for key in self.variables if key in variables)
+        return self._value_meanings(instance)
+
+    @cached_property
+    def key(self):
+        """Stable key of the template's random streams, derived from its question text"""
+        from .rng_streams import stream_key
+        return stream_key(self.question_template)
 
-    def generate(self, setting, show_deduction=True):
+    def renderer(self, show_deduction):
+        """Compiled renderer for the question, optionally followed by the deduction"""
+        if show_deduction:
+            return compile_template(self.question_template + "\n" + self.deduction_template + "\n")
+        return compile_template(self.question_template)
+
+    def variable_generator(self, setting, constrained=True, max_tries=1000):
+        """
+        Draw one set of variables from the global `random` module (in declaration order).
+
+        With constrained, the whole set is redrawn until `is_valid`; a set that is valid on
+        the first draw is the same as without constraints.
+        """
+        for _ in range(max_tries):
+            variables = {key: domain.sample(setting) for key, domain in self.variables.items()}
+            if not constrained or self.is_valid(variables):
+                return variables
+        raise ValueError(f"no valid variables for {self.type_name} after {max_tries} draws")
+
+    def numeric_variables(self):
+        return [key for key, domain in self.variables.items() if domain.is_numeric]
+
+    def valid_mask(self, values):
+        """Whether the numeric constraints hold, element-wise if values are NumPy columns"""
+        values = dict(values)
+        answers = self.answer_generator(values)
+        values.update(answers)
+        mask = True
+        for key in answers:
+            mask = mask & (values[key] >= 0)
+        for constraint in self.constraints:
+            mask = mask & constraint(values)
+        return mask
+
+    def is_valid(self, variables):
+        if not self.valid_mask(variables):
+            return False
+        return all(len({variables[key] for key in group}) == len(group) for group in self.distinct)
+
+    @cached_property
+    def valid_grid(self):
+        """
+        Every valid combination of the numeric variables as columns,
+        or None if there are more than ENUMERATE_LIMIT combinations.
+        """
+        import numpy as np
+
+        numeric = self.numeric_variables()
+        axes = [np.asarray(self.variables[key].support()) for key in numeric]
+        if not numeric or np.prod([len(axis) for axis in axes], dtype=float) > ENUMERATE_LIMIT:
+            return None
+        grid = np.meshgrid(*axes, indexing="ij")
+        columns = {key: values.ravel() for key, values in zip(numeric, grid)}
+        mask = np.broadcast_to(self.valid_mask(columns), grid[0].size)
+        if not mask.any():
+            raise ValueError(f"constraints of {self.type_name} exclude every combination")
+        return {key: values[mask] for key, values in columns.items()}
+
+    def sample_numeric(self, n, rng):
+        """Valid numeric variables for n instances, uniform over the valid combinations"""
+        import numpy as np
+
+        numeric = self.numeric_variables()
+        if not numeric:
+            return {}
+        grid = self.valid_grid
+        if grid is not None:
+            rows = rng.integers(0, len(grid[numeric[0]]), size=n)
+            return {key: grid[key][rows] for key in numeric}
+
+        # too many combinations to enumerate: every instance keeps its first valid draw
+        columns = {key: self.variables[key].sample_batch(None, n, rng) for key in numeric}
+        valid = np.broadcast_to(self.valid_mask(columns), n).copy()
+        for _ in range(MAX_REJECTION_ROUNDS):
+            if valid.all():
+                return columns
+            redraw = {key: self.variables[key].sample_batch(None, n, rng) for key in numeric}
+            accept = self.valid_mask(redraw) & ~valid
+            columns = {key: np.where(accept, redraw[key], columns[key]) for key in numeric}
+            valid |= accept
+        raise ValueError(f"no valid variables for {self.type_name} after {MAX_REJECTION_ROUNDS} rounds")
+
+    def sample_variables(self, setting, n, rng):
+        """Variables for n instances as NumPy columns, satisfying constraints and distinct groups"""
+        numeric = self.sample_numeric(n, rng.spawn())
+        group_of = {key: group for group in self.distinct for key in group}
+        columns = {}
+        for key, domain in self.variables.items():
+            if key in columns:
+                continue
+            if domain.is_numeric:
+                columns[key] = numeric[key]
+            elif key in group_of:
+                group = group_of[key]
+                columns.update(zip(group, domain.sample_distinct(setting, n, rng, len(group))))
+            else:
+                columns[key] = domain.sample_batch(setting, n, rng)
+        return columns
+
+    def generate(self, setting, show_deduction=True, seed=None, index=0):
         """
         setting is a list that specifies specification for generating an instance
+
+        If seed is given, the instance is drawn from its own stream (template, seed, index)
+        instead of the global `random` / `np.random` state, see `generate_batch`.
         """
+        if seed is not None:
+            return self.generate_batch(setting, 1, seed=seed, start=index, show_deduction=show_deduction)[0]
+
+        import numpy as np
+
         variables = self.variable_generator(setting)
         # modify "variables" to create different variant of the template
         perm = np.random.permutation(len(SYMBOL_NUMBERS))
@@ -191,27 +488,148 @@ class TaskTemplate:
         answer_dict = self.formula_generator(variables) if setting["gen_formula"] else self.answer_generator(variables)
         answer_dict.update(variables)
 
-        formatted_question = self.question_template.format(**answer_dict)
-        formatted_deduction = self.deduction_template.format(**answer_dict) + "\n"
-        if show_deduction:
-            formatted_question += "\n" + formatted_deduction 
-
-        # Extract answer variable from the last line
-        import re
-
-        pattern = r"#### (.*)\n" if setting["gen_formula"] else r"#### (\w+)"
-        match = re.search(pattern, formatted_deduction)
-        answer = match.group(1) if match else None
-
         return {
             "type_name": self.type_name,
-            "question": formatted_question,
-            "answer": answer,
+            "question": self.renderer(show_deduction).render(answer_dict),
+            "answer": str(answer_dict[self.answer_field]),
         }
 
+    def streams(self, seeds, indices, salt=None):
+        """
+        Per-instance random streams for instance indices[i] of seeds[i] (seeds may be a single int).
+
+        A salt (any value with a stable repr) gives streams independent of the unsalted ones,
+        e.g. one set per dataset config.
+        """
+        import numpy as np
+        from .rng_streams import InstanceStreams, stream_key
+
+        parts = () if salt is None else (salt,)
+        if np.ndim(seeds) == 0:
+            keys = stream_key(self.key, seeds, *parts)
+        else:
+            keys = np.array([stream_key(self.key, seed, *parts) for seed in seeds], dtype=np.uint64)
+        return InstanceStreams(keys, indices)
 
-task_templates = [
-    TaskTemplate(
+    def sample_columns(self, setting, n, rng):
+        """
+        Variables and answers (or formulas) for n instances, drawn column-wise from rng.
+
+        Returns:
+            {name: list of n values}
+        """
+        import numpy as np
+
+        columns = self.sample_variables(setting, n, rng)
+        numeric = self.numeric_variables()
+
+        if setting["gen_formula"]:
+            # formulas only depend on which symbol each number gets
+            if setting["gen_formula_sample_symbol"]:
+                perms = np.argsort(rng.random((n, len(SYMBOL_NUMBERS))), axis=1)
+                symbols = np.asarray(SYMBOL_NUMBERS, dtype=object)
+                for j, key in enumerate(numeric):
+                    columns[key] = symbols[perms[:, j]]
+            else:
+                for j, key in enumerate(numeric):
+                    columns[key] = np.full(n, SYMBOL_NUMBERS[j], dtype=object)
+            columns = {key: col.tolist() for key, col in columns.items()}
+            for key, renderer in self.formula_renderers.items():
+                columns[key] = renderer.render_columns(columns, n)
+            return columns
+
+        if setting["flip_number_sign"]:
+            for key in numeric:
+                columns[key] = -columns[key]
+        columns.update(self.answer_generator(columns))
+        return {key: col.tolist() for key, col in columns.items()}
+
+    def instance_hashes(self, columns, n):
+        """Canonical hash of the variables of n instances, see .dedup"""
+        from .dedup import instance_hashes
+        return instance_hashes(self, columns, n)
+
+    def generate_batch(self, setting, n, seed=0, start=0, show_deduction=True, dedup=None):
+        """
+        Vectorized version of `generate` for instances start, ..., start + n - 1.
+
+        All variables are drawn as NumPy columns and answers are computed column-wise;
+        strings are only rendered at the very end. Instance i only depends on
+        (template, seed, i), so any split of the index range gives identical output.
+
+        Args:
+            dedup: optional ExactIndex / BloomIndex (see .dedup), instances already in
+                the index are dropped, so fewer than n may be returned
+
+        Returns:
+            list of dicts, same format as `generate`
+        """
+        import numpy as np
+
+        columns = self.sample_columns(setting, n, self.streams(seed, np.arange(start, start + n)))
+        if dedup is not None:
+            keep = dedup.add(self.type_name, self.instance_hashes(columns, n))
+            columns = {key: [value for value, k in zip(column, keep) if k] for key, column in columns.items()}
+            n = int(keep.sum())
+        return self.render_batch(columns, n, show_deduction)
+
+    def render_batch(self, columns, n, show_deduction=True):
+        """Instances from the columns of sample_columns, same format as `generate`"""
+        questions = self.renderer(show_deduction).render_columns(columns, n)
+        answers = list(map(str, columns[self.answer_field]))
+
+        return [
+            {"type_name": self.type_name, "question": question, "answer": answer}
+            for question, answer in zip(questions, answers)
+        ]
+
+
+# type_name -> function building the TaskTemplate, in definition order
+_template_builders = {}
+# type_name -> TaskTemplate, filled on first access
+_templates = {}
+
+
+def register_template(type_name):
+    """Register a template builder under type_name, the template is only built on first access"""
+    def decorator(builder):
+        if type_name in _template_builders:
+            raise ValueError(f"duplicate template {type_name}")
+        _template_builders[type_name] = builder
+        return builder
+    return decorator
+
+
+def get_template(type_name):
+    if type_name not in _templates:
+        _templates[type_name] = _template_builders[type_name]()
+    return _templates[type_name]
+
+
+def template_names():
+    return list(_template_builders)
+
+
+class _LazyTemplateList:
+    """Read-only list view of the registry (task_templates[i] as before), built on access"""
+
+    def __len__(self):
+        return len(_template_builders)
+
+    def __getitem__(self, index):
+        names = template_names()[index]
+        if isinstance(index, slice):
+            return [get_template(name) for name in names]
+        return get_template(names)
+
+    def __iter__(self):
+        for name in template_names():
+            yield get_template(name)
+
+
+@register_template("Tree Logging Calculation")
+def _tree_logging_calculation():
+    return TaskTemplate(
         type_name="Tree Logging Calculation",
         question_template="""Question: {name} is cutting up wood for his wood-burning stove. Each {pine} tree makes {pine_logs} logs, each {maple} tree makes {maple_logs} logs, and each {walnut} tree makes {walnut_logs} logs. If {name} cuts up {pine_count} {pine} trees, {maple_count} {maple} trees, and {walnut_count} {walnut} trees, how many logs does he get?""",
         deduction_template="""Answer: Let's think step by step. First find the total number of {pine} logs by multiplying the number of trees by the number of logs per tree: {pine_logs} logs/{pine} * {pine_count} {pine} = <<{pine_logs}*{pine_count}={total_pine}>>{total_pine} logs
@@ -219,39 +637,31 @@ Then do the same thing for the {maple} trees: {maple_logs} logs/{maple} * {maple
 And do the same thing for the {walnut} trees: {walnut_logs} logs/{walnut} * {walnut_count} {walnut} = <<{walnut_logs}*{walnut_count}={total_walnut}>>{total_walnut} logs
 Finally, add up the number of logs from each type of tree to find the total number: {total_pine} logs + {total_maple} logs + {total_walnut} logs = <<{total_pine}+{total_maple}+{total_walnut}={total}>>{total} logs
 #### {total}""",
-        variable_generator=lambda setting: {
-            "name": get_random_name(setting),
-            "pine": get_random_item(setting),
-            "maple": get_random_item(setting),
-            "walnut": get_random_item(setting),
-            "pine_logs": random.randint(50, 100),
-            "maple_logs": random.randint(40, 80),
-            "walnut_logs": random.randint(60, 120),
-            "pine_count": random.randint(5, 10),
-            "maple_count": random.randint(2, 5),
-            "walnut_count": random.randint(3, 6),
-        },
-        answer_generator=lambda vars: {
-            "total_pine": vars["pine_logs"] * vars["pine_count"],
-            "total_maple": vars["maple_logs"] * vars["maple_count"],
-            "total_walnut": vars["walnut_logs"] * vars["walnut_count"],
-            "total": (
-                vars["pine_logs"] * vars["pine_count"]
-                + vars["maple_logs"] * vars["maple_count"]
-                + vars["walnut_logs"] * vars["walnut_count"]
-            ),
+        variables={
+            "name": Name(),
+            "pine": Item(),
+            "maple": Item(),
+            "walnut": Item(),
+            "pine_logs": IntRange(50, 100),
+            "maple_logs": IntRange(40, 80),
+            "walnut_logs": IntRange(60, 120),
+            "pine_count": IntRange(5, 10),
+            "maple_count": IntRange(2, 5),
+            "walnut_count": IntRange(3, 6),
         },
-        formula_generator=lambda vars: {
-            "total_pine": vars["pine_logs"] + "*" + vars["pine_count"],
-            "total_maple": vars["maple_logs"] + "*" + vars["maple_count"],
-            "total_walnut": vars["walnut_logs"] + "*" + vars["walnut_count"],
-            "total": 
-                vars["pine_logs"] + "*" + vars["pine_count"]
-                + "+" + vars["maple_logs"] + "*" + vars["maple_count"]
-                + "+" + vars["walnut_logs"] + "*" + vars["walnut_count"]
+        computation={
+            "total_pine": V("pine_logs") * V("pine_count"),
+            "total_maple": V("maple_logs") * V("maple_count"),
+            "total_walnut": V("walnut_logs") * V("walnut_count"),
+            "total": V("total_pine") + V("total_maple") + V("total_walnut"),
         },
-    ),
-    TaskTemplate(
+        distinct=[("pine", "maple", "walnut")],
+    )
+
+
+@register_template("Fruit Roll-Up Contest")
+def _fruit_roll_up_contest():
+    return TaskTemplate(
         type_name="Fruit Roll-Up Contest",
         question_template="""Question: {A} and {B} are having a contest to see who can eat the most fruit roll-ups, so they unroll as many as they can find. Unfortunately, someone makes a mistake and {A}'s was {A_roll} roll-ups wide and {A_num_roll} rolls up long while {B}'s was {B_roll} roll-ups wide and {B_num_roll} roll-ups long. If they both ate their entire amount, how many did they eat on average?""",
         deduction_template="""Answer: Let's think step by step. {A} ate {A_total} because {A_roll} x {A_num_roll} = <<{A_roll}*{A_num_roll}={A_total}>>{A_total}.
@@ -259,36 +669,29 @@ Finally, add up the number of logs from each type of tree to find the total numb
 In total they ate {total} because {A_total} + {B_total} = <<{A_total}+{B_total}={total}>>{total}.
 On average they ate {average} because {total} / 2 = <<{total}/2={average}>>{average}.
 #### {average}""",
-        variable_generator=lambda setting: {
-            "A": get_random_name(setting),
-            "B": get_random_name(setting),
-            "A_roll": random.choice([2, 3, 4]),
-            "A_num_roll": random.choice([2, 4, 8]),
-            "B_roll": random.choice([2, 3, 4]),
-            "B_num_roll": random.choice([2, 4, 8]),
+        variables={
+            "A": Name(),
+            "B": Name(),
+            "A_roll": Choice([2, 3, 4]),
+            "A_num_roll": Choice([2, 4, 8]),
+            "B_roll": Choice([2, 3, 4]),
+            "B_num_roll": Choice([2, 4, 8]),
         },
-        answer_generator=lambda vars: {
-            "A_total": vars["A_roll"] * vars["A_num_roll"],
-            "B_total": vars["B_roll"] * vars["B_num_roll"],
-            "total": vars["A_roll"] * vars["A_num_roll"]
-            + vars["B_roll"] * vars["B_num_roll"],
-            "average": (
-                vars["A_roll"] * vars["A_num_roll"]
-                + vars["B_roll"] * vars["B_num_roll"]
-            )
-            // 2,
+        computation={
+            "A_total": V("A_roll") * V("A_num_roll"),
+            "B_total": V("B_roll") * V("B_num_roll"),
+            "total": V("A_total") + V("B_total"),
+            "average": V("total") / 2,
         },
-        formula_generator=lambda vars: {
-            "A_total": vars["A_roll"] + "*" + vars["A_num_roll"],
-            "B_total": vars["B_roll"] + "*" + vars["B_num_roll"],
-            "total": vars["A_roll"] + "*" + vars["A_num_roll"]
-            + "+" + vars["B_roll"] + "*" + vars["B_num_roll"],
-            "average": 
-                "(" + vars["A_roll"] + "*" + vars["A_num_roll"]
-                + "+" + vars["B_roll"] + "*" + vars["B_num_roll"] + ")" + "/2"
-        },
-    ),
-    TaskTemplate(
+        # the average is computed with //
+        constraints=[lambda vars: vars["total"] % 2 == 0],
+        distinct=[("A", "B")],
+    )
+
+
+@register_template("Batting cages")
+def _batting_cages():
+    return TaskTemplate(
         type_name="Batting cages",
         question_template="""Question: {name1} and {name2} went to the batting cages. Each token gets you {pitches} pitches. {name1} used {tokens1} tokens and {name2} used {tokens2} tokens. {name1} hit the ball {hits1} times and {name2} hit the ball {hits2} times. How many pitches did {name1} and {name2} miss altogether?""",
         deduction_template="""Answer: Let's think step by step. {name1} used {tokens1} tokens which are worth {pitches} pitches each, so {tokens1} tokens x {pitches} pitches = <<{tokens1}*{pitches}={total_pitches1}>>{total_pitches1} pitches.
@@ -297,38 +700,29 @@ Together, {name1} and {name2} received {total_pitches1} + {total_pitches2} = <<{
 {name1} hit the ball {hits1} times + {name2}’s {hits2} hits = <<{hits1}+{hits2}={total_hits}>>{total_hits} total hits.
 Of the {total_pitches} pitches – {total_hits} total hits = <<{total_pitches}-{total_hits}={misses}>>{misses} misses.
 #### {misses}""",
-        variable_generator=lambda setting: {
-            "name1": get_random_name(setting),
-            "name2": get_random_name(setting),
-            "pitches": random.randint(10, 20),
-            "tokens1": random.randint(10, 20),
-            "tokens2": random.randint(10, 20),
-            "hits1": random.randint(10, 20),
-            "hits2": random.randint(10, 20),
-        },
-        answer_generator=lambda vars: {
-            "total_pitches1": vars["tokens1"] * vars["pitches"],
-            "total_pitches2": vars["tokens2"] * vars["pitches"],
-            "total_pitches": vars["tokens1"] * vars["pitches"]
-            + vars["tokens2"] * vars["pitches"],
-            "total_hits": vars["hits1"] + vars["hits2"],
-            "misses": (
-                vars["tokens1"] * vars["pitches"] + vars["tokens2"] * vars["pitches"]
-            )
-            - (vars["hits1"] + vars["hits2"]),
+        variables={
+            "name1": Name(),
+            "name2": Name(),
+            "pitches": IntRange(10, 20),
+            "tokens1": IntRange(10, 20),
+            "tokens2": IntRange(10, 20),
+            "hits1": IntRange(10, 20),
+            "hits2": IntRange(10, 20),
         },
-        formula_generator=lambda vars: {
-            "total_pitches1": vars["tokens1"] + "*" + vars["pitches"],
-            "total_pitches2": vars["tokens2"] + "*" + vars["pitches"],
-            "total_pitches": vars["tokens1"] + "*" + vars["pitches"]
-            + "+" + vars["tokens2"] + "*" + vars["pitches"],
-            "total_hits": vars["hits1"] + "+" + vars["hits2"],
-            "misses": 
-                vars["tokens1"] + "*" + vars["pitches"] + "+" + vars["tokens2"] + "*" + vars["pitches"]
-                + "-" + "(" + vars["hits1"] + "+" + vars["hits2"] + ")",
+        computation={
+            "total_pitches1": V("tokens1") * V("pitches"),
+            "total_pitches2": V("tokens2") * V("pitches"),
+            "total_pitches": V("total_pitches1") + V("total_pitches2"),
+            "total_hits": V("hits1") + V("hits2"),
+            "misses": V("total_pitches") - V("total_hits"),
         },
-    ),
-    TaskTemplate(
+        distinct=[("name1", "name2")],
+    )
+
+
+@register_template("Waterslide")
+def _waterslide():
+    return TaskTemplate(
         type_name="Waterslide",
         question_template="""Question: The biggest {waterslide} at Five Flags is {big_slide} feet long, and people slide down at {big_speed} feet/minute. The second biggest {waterslide} is {small_slide} feet long, but steeper, so people slide down at {small_speed} feet/minute. How much longer does it take to ride the biggest {waterslide} compared to the second biggest {waterslide}?""",
         deduction_template="""Answer: Let's think step by step. 
@@ -336,57 +730,55 @@ First find the ride length of the biggest {waterslide}: {big_slide} feet / {big_
 Then find the ride length of the second biggest {waterslide}: {small_slide} feet / {small_speed} feet/minute = <<{small_slide}/{small_speed}={small_time}>>{small_time} minutes
 Then subtract the ride length of the second longest slide from the longest slide to find the difference: {big_time} minutes - {small_time} minutes = <<{big_time}-{small_time}={difference}>>{difference} minutes
 #### {difference}""",
-        variable_generator=lambda setting: {
-            "waterslide": get_random_item(setting),
-            "big_slide": random.choice([480, 600]),
-            "small_slide": random.choice([120, 180]),
-            "big_speed": random.choice([20, 30]),
-            "small_speed": random.choice([40, 60]),
-        },
-        answer_generator=lambda vars: {
-            "big_time": vars["big_slide"] // vars["big_speed"],
-            "small_time": vars["small_slide"] // vars["small_speed"],
-            "difference": vars["big_slide"] // vars["big_speed"]
-            - vars["small_slide"] // vars["small_speed"],
+        variables={
+            "waterslide": Item(),
+            "big_slide": Choice([480, 600]),
+            "small_slide": Choice([120, 180]),
+            "big_speed": Choice([20, 30]),
+            "small_speed": Choice([40, 60]),
         },
-        formula_generator=lambda vars: {
-            "big_time": vars["big_slide"] + "/" +  vars["big_speed"],
-            "small_time": vars["small_slide"] + "/" + vars["small_speed"],
-            "difference": vars["big_slide"] + "/" + vars["big_speed"]
-            + "-" + vars["small_slide"] + "/" + vars["small_speed"],
+        computation={
+            "big_time": V("big_slide") / V("big_speed"),
+            "small_time": V("small_slide") / V("small_speed"),
+            "difference": V("big_time") - V("small_time"),
         },
-    ),
-    TaskTemplate(
+        constraints=[
+            lambda vars: vars["big_slide"] % vars["big_speed"] == 0,
+            lambda vars: vars["small_slide"] % vars["small_speed"] == 0,
+        ],
+    )
+
+
+@register_template("Water left")
+def _water_left():
+    return TaskTemplate(
         type_name="Water left",
         question_template="""Question: Two girls each got 1/{part} of the {amount} liters of {water}. Then a boy got {boy_amount} liters of {water}. How many liters of {water} were left?""",
         deduction_template="""Answer:
-Each of the girls got {amount} x 1/{part} = <<{amount}*{part}={girl_amount}>>{girl_amount} liters of water.
+Each of the girls got {amount} x 1/{part} = <<{amount}/{part}={girl_amount}>>{girl_amount} liters of water.
 So the two girls got a total of {girl_amount} x 2 = <<{girl_amount}*2={total_girl_amount}>>{total_girl_amount} liters.
 Thus, a total of {total_girl_amount} + {boy_amount} = <<{total_girl_amount}+{boy_amount}={total_amount}>>{total_amount} liters of water were gotten by the two girls and the boy.
 Therefore, {amount} - {total_amount} = <<{amount}-{total_amount}={left}>>{left} liters of water were left.
 #### {left}""",
-        variable_generator=lambda setting: {
-            "part": random.choice([3, 4]),
-            "amount": random.choice([12, 24, 60]),
-            "water": get_random_item(setting),
-            "boy_amount": random.randint(2, 5),
-        },
-        answer_generator=lambda vars: {
-            "girl_amount": vars["amount"] // vars["part"],
-            "total_girl_amount": (vars["amount"] // vars["part"]) * 2,
-            "total_amount": ((vars["amount"] // vars["part"]) * 2) + vars["boy_amount"],
-            "left": vars["amount"]
-            - (((vars["amount"] // vars["part"]) * 2) + vars["boy_amount"]),
+        variables={
+            "part": Choice([3, 4]),
+            "amount": Choice([12, 24, 60]),
+            "water": Item(),
+            "boy_amount": IntRange(2, 5),
         },
-        formula_generator=lambda vars: {
-            "girl_amount": vars["amount"] + "/" + vars["part"],
-            "total_girl_amount": vars["amount"] + "/" + vars["part"] + "*" + "2",
-            "total_amount": vars["amount"] + "/" + vars["part"] + "*" + "2" + "+" + vars["boy_amount"],
-            "left": vars["amount"]
-            + "-" + "(" + vars["amount"] + "/" + vars["part"] + "*" + "2" + "+" + vars["boy_amount"] + ")",
+        computation={
+            "girl_amount": V("amount") / V("part"),
+            "total_girl_amount": V("girl_amount") * 2,
+            "total_amount": V("total_girl_amount") + V("boy_amount"),
+            "left": V("amount") - V("total_amount"),
         },
-    ),
-    TaskTemplate(
+        constraints=[lambda vars: vars["amount"] % vars["part"] == 0],
+    )
+
+
+@register_template("Butcher Sales")
+def _butcher_sales():
+    return TaskTemplate(
         type_name="Butcher Sales",
         question_template="""Question: {name} is a butcher. {pronoun} sells {rate}kg of meat every hour {pronoun} works, and {pronoun} works {hours} hours a day. {name2} gives {pronoun} a {animal} that weighs {weight}kg. How many days will it take {name} to sell the meat?""",
         deduction_template="""Answer: Let's think step by step. 
@@ -394,67 +786,70 @@ In a day {name} sells {rate}kg of meat every hour {pronoun} works, and {pronoun}
 So in a day {name} sells {rate} * {hours} = <<{rate}*{hours}={daily}>>{daily}kg of meat.
 It will take {name} {weight} / {daily} = <<{weight}/{daily}={days}>>{days} days to sell all the meat from the {animal}.
 #### {days}""",
-        variable_generator=lambda setting: {
-            "name": get_random_name(setting),
-            "name2": get_random_name(setting),
-            "rate": random.choice([5, 10]),
-            "hours": random.choice([6, 9]),
-            "animal": get_random_item(setting),
-            "weight": random.choice([360, 540, 900]),
-            "pronoun": "they",
+        variables={
+            "name": Name(),
+            "name2": Name(),
+            "rate": Choice([5, 10]),
+            "hours": Choice([6, 9]),
+            "animal": Item(),
+            "weight": Choice([360, 540, 900]),
+            "pronoun": Const("they"),
         },
-        answer_generator=lambda vars: {
-            "daily": vars["rate"] * vars["hours"],
-            "days": vars["weight"] // (vars["rate"] * vars["hours"]),
+        computation={
+            "daily": V("rate") * V("hours"),
+            "days": V("weight") / V("daily"),
         },
-        formula_generator=lambda vars: {
-            "daily": vars["rate"] + "*" + vars["hours"],
-            "days": vars["weight"] + "/" + "(" + vars["rate"] + "*" + vars["hours"] + ")",
-        },
-    ),
-    TaskTemplate(
+        constraints=[lambda vars: vars["weight"] % vars["daily"] == 0],
+        distinct=[("name", "name2")],
+    )
+
+
+@register_template("Pencil Pairs")
+def _pencil_pairs():
+    return TaskTemplate(
         type_name="Pencil Pairs",
         question_template="""Question: There is space for {total} {items} in the box. If there are {missing} {items} missing from the box, how many pairs of {items} are in the box?""",
         deduction_template="""Answer: Let's think step by step. 
 In the box there are {total} {items} - {missing} {items} = <<{total}-{missing}={actual}>>{actual} {items}.
 Dividing into pairs we have {actual} {items} / 2 {items}/pair = {pairs} pairs of {items}
 #### {pairs}""",
-        variable_generator=lambda setting="original": {
-            "total": random.choice([10, 12, 14, 16, 18, 20]),
-            "items": get_random_item(setting),
-            "missing": random.choice([2, 4, 6]),
-        },
-        answer_generator=lambda vars: {
-            "actual": vars["total"] - vars["missing"],
-            "pairs": (vars["total"] - vars["missing"]) // 2,
+        variables={
+            "total": Choice([10, 12, 14, 16, 18, 20]),
+            "items": Item(),
+            "missing": Choice([2, 4, 6]),
         },
-        formula_generator=lambda vars: {
-            "actual": vars["total"] + "-" + vars["missing"],
-            "pairs": "(" + vars["total"] + "-" + vars["missing"] + ")" + "/2",
+        computation={
+            "actual": V("total") - V("missing"),
+            "pairs": V("actual") / 2,
         },
-    ),
-    TaskTemplate(
+        constraints=[lambda vars: vars["actual"] % 2 == 0],
+    )
+
+
+@register_template("Total cards")
+def _total_cards():
+    return TaskTemplate(
         type_name="Total cards",
         question_template="""Question: A boy has {total} {items}. His brother has {diff} fewer {items} than he has. How many {items} do they have together?""",
         deduction_template="""Answer: Let's think step by step. 
 His brother has {total} - {diff} = <<{total}-{diff}={brother_total}>>{brother_total} {items}.
 Together, they have {total} + {brother_total} = <<{total}+{brother_total}={total_together}>>{total_together} {items}.
 #### {total_together}""",
-        variable_generator=lambda setting: {
-            "total": random.randint(15, 25),
-            "items": get_random_item(setting),
-            "diff": random.randint(2, 5),
+        variables={
+            "total": IntRange(15, 25),
+            "items": Item(),
+            "diff": IntRange(2, 5),
         },
-        answer_generator=lambda vars: {
-            "brother_total": vars["total"] - vars["diff"],
-            "total_together": vars["total"] + vars["total"] - vars["diff"],
+        computation={
+            "brother_total": V("total") - V("diff"),
+            "total_together": V("total") + V("brother_total"),
         },
-        formula_generator=lambda vars: {
-            "brother_total": vars["total"] + "-" + vars["diff"],
-            "total_together": vars["total"] + "+" + vars["total"] + "-" + vars["diff"],
-        },
-    ),
-    TaskTemplate(
+    )
+
+
+@register_template("Boat Rentals")
+def _boat_rentals():
+    return TaskTemplate(
         type_name="Boat Rentals",
         question_template="""Question: {name1} and {name2} are at the beach. {name1} rents a canoe for ${price1} an hour and {name2} rents a banana boat raft for ${price2} an hour. If {name1} uses the boat for {hours1} hours and {name2} uses the raft for {hours2} hours, how much will they pay for their rentals, altogether?""",
         deduction_template="""Answer: Let's think step by step. 
@@ -462,137 +857,124 @@ Together, they have {total} + {brother_total} = <<{total}+{brother_total}={total
 {name2} would have to pay ${price2} x {hours2} = $<<{price2}*{hours2}={total2}>>{total2}
 All together, {name1} and {name2} will have to pay ${total1} + ${total2} = $<<{total1}+{total2}={total_together}>>{total_together}
 #### {total_together}""",
-        variable_generator=lambda setting: {
-            "name1": get_random_name(setting),
-            "name2": get_random_name(setting),
-            "price1": random.randint(10, 20),
-            "price2": random.randint(10, 20),
-            "hours1": random.randint(1, 3),
-            "hours2": random.randint(1, 3),
-        },
-        answer_generator=lambda vars: {
-            "total1": vars["price1"] * vars["hours1"],
-            "total2": vars["price2"] * vars["hours2"],
-            "total_together": vars["price1"] * vars["hours1"]
-            + vars["price2"] * vars["hours2"],
+        variables={
+            "name1": Name(),
+            "name2": Name(),
+            "price1": IntRange(10, 20),
+            "price2": IntRange(10, 20),
+            "hours1": IntRange(1, 3),
+            "hours2": IntRange(1, 3),
         },
-        formula_generator=lambda vars: {
-            "total1": vars["price1"] + "*" + vars["hours1"],
-            "total2": vars["price2"] + "*" + vars["hours2"],
-            "total_together": vars["price1"] + "*" + vars["hours1"]
-            + "+" + vars["price2"] + "*" + vars["hours2"],
+        computation={
+            "total1": V("price1") * V("hours1"),
+            "total2": V("price2") * V("hours2"),
+            "total_together": V("total1") + V("total2"),
         },
-    ),
-    TaskTemplate(
+        distinct=[("name1", "name2")],
+    )
+
+
+@register_template("Playlist Hours")
+def _playlist_hours():
+    return TaskTemplate(
         type_name="Playlist Hours",
         question_template="""Question: The number of {songs} in a playlist is {total}. If John has {num} such playlists, and each {songs} is {hours} hours long, how many hours will the {num} playlists last in total?""",
         deduction_template="""Answer: Let's think step by step. 
 Since each playlist has {total} {songs}, the total number of {songs} in the {num} playlists is {num}*{total}= <<{num}*{total}={total_songs}>>{total_songs}.
 If each {songs} is {hours} hours long, the {total_songs} {songs} in the {num} playlists last a total of {total_songs}*{hours} = <<{total_songs}*{hours}={total_hours}>>{total_hours} hours
 #### {total_hours}""",
-        variable_generator=lambda setting: {
-            "songs": get_random_item(setting),
-            "total": random.randint(10, 20),
-            "num": random.randint(2, 4),
-            "hours": random.randint(2, 4),
+        variables={
+            "songs": Item(),
+            "total": IntRange(10, 20),
+            "num": IntRange(2, 4),
+            "hours": IntRange(2, 4),
         },
-        answer_generator=lambda vars: {
-            "total_songs": vars["num"] * vars["total"],
-            "total_hours": vars["num"] * vars["total"] * vars["hours"],
+        computation={
+            "total_songs": V("num") * V("total"),
+            "total_hours": V("total_songs") * V("hours"),
         },
-        formula_generator=lambda vars: {
-            "total_songs": vars["num"] + "*" + vars["total"],
-            "total_hours": vars["num"] + "*" + vars["total"] + "*" + vars["hours"],
-        },
-    ),
-    TaskTemplate(
+    )
+
+
+@register_template("Doughnuts")
+def _doughnuts():
+    return TaskTemplate(
         type_name="Doughnuts",
         question_template="""Question: A {box} holds {num_dozen} dozen {items}. If the family ate {num} {items}, how many {items} are left?""",
         deduction_template="""Answer: Let's think step by step. {num_dozen} dozen {items} are equal to {num_dozen} x 12 = <<{num_dozen}*12={total}>>{total} {items}.
 Since {num} {items} were eaten, therefore {total} - {num} = <<{total}-{num}={left}>>{left} {items} are left.
 #### {left}""",
-        variable_generator=lambda setting: {
-            "box": get_random_item(setting),
-            "items": get_random_item(setting),
-            "num_dozen": random.randint(2, 5),
-            "num": random.randint(2, 5),
-        },
-        answer_generator=lambda vars: {
-            "total": vars["num_dozen"] * 12,
-            "left": vars["num_dozen"] * 12 - vars["num"],
+        variables={
+            "box": Item(),
+            "items": Item(),
+            "num_dozen": IntRange(2, 5),
+            "num": IntRange(2, 5),
         },
-        formula_generator=lambda vars: {
-            "total": vars["num_dozen"] + "*" + "12",
-            "left": vars["num_dozen"] + "*" + "12" + "-" + vars["num"],
+        computation={
+            "total": V("num_dozen") * 12,
+            "left": V("total") - V("num"),
         },
-    ),
-    TaskTemplate(
-        type_name="",
+        distinct=[("box", "items")],
+    )
+
+
+@register_template("TV Work Hours")
+def _tv_work_hours():
+    return TaskTemplate(
+        type_name="TV Work Hours",
         question_template="""Question: {name} wants to buy a Samsung TV worth ${price}. She works for a delivery service company for a month earning ${hourly} per hour for a {hours}-hour workweek. How many more hours does she have to work to buy the TV?""",
         deduction_template="""Let's think step by step. In a week, {name} earns {hours}*{hourly} = $<<{hours}*{hourly}={weekly}>>{weekly}.
 In a month, she earns {weekly}*4 = $<<{weekly}*4={monthly}>>{monthly}.
 If the TV was worth ${price}, the total amount she has to work for to buy the TV is ${price}-{monthly} = $<<{price}-{monthly}={left}>>{left}.
 Since she earns ${hourly} per hour, she'll have to work for ${left}/${hourly} = <<{left}/{hourly}={hours_left}>>{hours_left} more hours to buy the TV.
 #### {hours_left}""",
-        variable_generator=lambda setting: {
-            "name": get_random_name(setting),
-            "price": random.choice([4000, 5000]),
-            "hourly": random.choice([10, 20]),
-            "hours": random.choice([30, 35, 40]),
+        variables={
+            "name": Name(),
+            "price": Choice([4000, 5000]),
+            "hourly": Choice([10, 20]),
+            "hours": Choice([30, 35, 40]),
         },
-        answer_generator=lambda vars: {
-            "weekly": vars["hours"] * vars["hourly"],
-            "monthly": vars["hours"] * vars["hourly"] * 4,
-            "left": vars["price"] - vars["hours"] * vars["hourly"] * 4,
-            "hours_left": (vars["price"] - vars["hours"] * vars["hourly"] * 4)
-            // vars["hourly"],
+        computation={
+            "weekly": V("hours") * V("hourly"),
+            "monthly": V("weekly") * 4,
+            "left": V("price") - V("monthly"),
+            "hours_left": V("left") / V("hourly"),
         },
-        formula_generator=lambda vars: {
-            "weekly": vars["hours"] + "*" + vars["hourly"],
-            "monthly": vars["hours"] + "*" + vars["hourly"] + "*" + "4",
-            "left": vars["price"] + "-" + vars["hours"] + "*" + vars["hourly"] + "*" + "4",
-            "hours_left": "(" + vars["price"] + "-" + vars["hours"] + "*" + vars["hourly"] + "*" + "4" + ")" + "/" + vars["hourly"]
-        },
-    ),
-    TaskTemplate(
-        type_name="",
+        constraints=[lambda vars: vars["left"] % vars["hourly"] == 0],
+    )
+
+
+@register_template("Savings Shortfall")
+def _savings_shortfall():
+    return TaskTemplate(
+        type_name="Savings Shortfall",
         question_template="""Question: {name} wants to buy a {item1} that costs ${price1}, a {item2} that costs ${price2}, and a {item3} that costs ${price3}. She has saved ${saved} from her allowance, and her mother gave her ${mother} more. How much more money does {name} need to buy the {item1}, the {item2}, and the {item3}?""",
         deduction_template="""Answer: Let's think step by step. 
 The total cost of the {item1}, the {item2}, and the {item3} is ${price1} + ${price2} + ${price3} = $<<{price1}+{price2}+{price3}={total}>>{total}.
 The total amount of money from the allowance and her mother is ${saved} + ${mother} = $<<{saved}+{mother}={total_saved}>>{total_saved}.
 {name} needs ${total} − ${total_saved} = $<<{total}-{total_saved}={left}>>{left}.
 #### {left}""",
-        variable_generator=lambda setting: {
-            "name": get_random_name(setting),
-            "item1": get_random_item(setting),
-            "item2": get_random_item(setting),
-            "item3": get_random_item(setting),
-            "price1": random.randint(10, 20),
-            "price2": random.randint(10, 20),
-            "price3": random.randint(10, 20),
-            "saved": random.randint(10, 20),
-            "mother": random.randint(10, 20),
-        },
-        answer_generator=lambda vars: {
-            "total": vars["price1"] + vars["price2"] + vars["price3"],
-            "total_saved": vars["saved"] + vars["mother"],
-            "left": vars["price1"]
-            + vars["price2"]
-            + vars["price3"]
-            - vars["saved"]
-            - vars["mother"],
+        variables={
+            "name": Name(),
+            "item1": Item(),
+            "item2": Item(),
+            "item3": Item(),
+            "price1": IntRange(10, 20),
+            "price2": IntRange(10, 20),
+            "price3": IntRange(10, 20),
+            "saved": IntRange(10, 20),
+            "mother": IntRange(10, 20),
         },
-        formula_generator=lambda vars: {
-            "total": vars["price1"] + "+" + vars["price2"] + "+" + vars["price3"],
-            "total_saved": vars["saved"] + "+" + vars["mother"],
-            "left": vars["price1"]
-            + "+" + vars["price2"]
-            + "+" + vars["price3"]
-            + "-" + vars["saved"]
-            + "-" + vars["mother"],
+        computation={
+            "total": V("price1") + V("price2") + V("price3"),
+            "total_saved": V("saved") + V("mother"),
+            "left": V("total") - V("total_saved"),
         },
-    ),
-]
+        distinct=[("item1", "item2", "item3")],
+    )
+
+
+task_templates = _LazyTemplateList()
 
 setting_default = {
     "name_format": "original", # "original" | "symbol" 
@@ -640,6 +1022,9 @@ def generate_task_with_context(setting, num_shots):
     full_prompt += target_example["question"]
     answer = target_example["answer"]
 
+    from pdb import set_trace as pds
+    from pprint import pprint as pp
+
     retval = {"prompt": full_prompt, "answer": answer, "type": target_template.type_name, "gen_formula_list": gen_formula_list}
     
     pp(retval)
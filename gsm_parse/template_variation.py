@@ -27,3 +27,24 @@ plural_wording = {
     "Simplified": "units",
 }
 
+
+
+# type_name -> (question wordings, word in the deduction to replace, replacement per wording)
+template_wordings = {
+    "Tree Logging Calculation": (question_wording, "logs", plural_wording),
+}
+
+
+def get_wordings(template):
+    """
+    All wordings of a template, "original" first.
+
+    Returns:
+        {wording: (question_template, replacements applied to the deduction)}
+    """
+    wordings = {"original": (template.question_template, {})}
+    if template.type_name in template_wordings:
+        questions, word, plurals = template_wordings[template.type_name]
+        for key, question in questions.items():
+            wordings[key] = (question, {word: plurals[key]})
+    return wordings
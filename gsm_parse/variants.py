@@ -0,0 +1,90 @@
+"""
+Cartesian variant engine: wordings x seeds x setting formats for any template.
+
+Variables are sampled once per seed (the instance `index` of that seed's stream, same
+as template.generate(setting, seed=seed, index=index)) and shared by every wording;
+each wording only re-renders its question, and deductions are only rendered once per
+distinct deduction replacement.
+"""
+import itertools
+import numpy as np
+
+from .render import compile_template
+from .template_variation import get_wordings
+
+# order of the axes in the product, the last one varies fastest
+AXES = ["seed", "wording", "name_format", "item_format", "flip_number_sign", "gen_formula"]
+
+
+def variant_axes(
+    template,
+    seeds,
+    wordings=None,
+    name_format=("original",),
+    item_format=("original",),
+    flip_number_sign=(False,),
+    gen_formula=(False,),
+):
+    """Axis values in AXES order, wordings default to all wordings of the template"""
+    return {
+        "seed": list(seeds),
+        "wording": list(wordings) if wordings is not None else list(get_wordings(template)),
+        "name_format": list(name_format),
+        "item_format": list(item_format),
+        "flip_number_sign": list(flip_number_sign),
+        "gen_formula": list(gen_formula),
+    }
+
+
+def num_variants(axes):
+    return int(np.prod([len(axes[axis]) for axis in AXES]))
+
+
+def iter_variants(template, axes, index=0, gen_formula_sample_symbol=False, chunk_size=1024):
+    """
+    Stream the full cartesian product of `axes` (see variant_axes).
+
+    sample_id is the position in the product, so it is stable for given axes.
+
+    Yields:
+        dict with the axis values, sample_id, question, deduction and answer
+    """
+    all_wordings = get_wordings(template)
+    wordings = {key: all_wordings[key] for key in axes["wording"]}
+    questions = {key: compile_template(question) for key, (question, _) in wordings.items()}
+    # wordings with the same replacements share the rendered deduction
+    deductions = {
+        key: compile_template(template.deduction_template, replacements)
+        for key, (_, replacements) in wordings.items()
+    }
+    formats = list(itertools.product(*(axes[axis] for axis in AXES[2:])))
+    per_seed = len(wordings) * len(formats)
+
+    seeds = axes["seed"]
+    for chunk_start in range(0, len(seeds), chunk_size):
+        chunk = seeds[chunk_start: chunk_start + chunk_size]
+        n = len(chunk)
+
+        # rendered[wording][format] -> (questions, deductions, answers) for the seeds in chunk
+        rendered = {key: {} for key in wordings}
+        for fmt in formats:
+            setting = dict(zip(AXES[2:], fmt), gen_formula_sample_symbol=gen_formula_sample_symbol)
+            columns = template.sample_columns(setting, n, template.streams(chunk, np.full(n, index)))
+            answers = list(map(str, columns[template.answer_field]))
+            deduction_cache = {}
+            for key in wordings:
+                deduction = deductions[key]
+                if deduction not in deduction_cache:
+                    deduction_cache[deduction] = deduction.render_columns(columns, n)
+                rendered[key][fmt] = (questions[key].render_columns(columns, n), deduction_cache[deduction], answers)
+
+        for i, seed in enumerate(chunk):
+            sample_id = (chunk_start + i) * per_seed
+            for key in wordings:
+                for fmt in formats:
+                    question, deduction, answer = (column[i] for column in rendered[key][fmt])
+                    item = {"sample_id": sample_id, "type_name": template.type_name, "seed": seed, "wording": key}
+                    item.update(zip(AXES[2:], fmt))
+                    item.update({"question": question, "deduction": deduction, "answer": answer})
+                    yield item
+                    sample_id += 1
@@ -0,0 +1,115 @@
+"""
+Arithmetic check of every <<expression=result>> annotation of a response.
+
+Expressions are evaluated with calc_parser (no eval) and memoized on the normalized
+expression, so "90*10", "90 * 10" and "$90*10" are computed once for all responses of all
+wordings and models.
+"""
+from functools import lru_cache
+from multiprocessing import Pool
+
+import numpy as np
+
+from .calc_parser import CALC_RE, CalcSyntaxError, evaluate, parse_expression, parse_result, render
+
+# relative tolerance for results with decimals
+TOLERANCE = 1e-6
+
+UNPARSED, CORRECT, WRONG = 0, 1, 2
+
+
+@lru_cache(maxsize=1 << 18)
+def normalize_expression(expression):
+    """Canonical text of an expression, None if it does not parse"""
+    try:
+        return render(parse_expression(expression))
+    except CalcSyntaxError:
+        return None
+
+
+@lru_cache(maxsize=1 << 18)
+def evaluate_normalized(normalized):
+    """Value of a normalized expression, None if it has symbols or divides by zero"""
+    return evaluate(parse_expression(normalized))
+
+
+def _close(value, claimed):
+    return abs(value - claimed) <= TOLERANCE * max(1.0, abs(value))
+
+
+@lru_cache(maxsize=1 << 18)
+def check_calculation(expression, result):
+    """
+    Returns:
+        (status, expected value) with status UNPARSED, CORRECT or WRONG; annotations that
+        cannot be checked (symbols, non-numeric result) are UNPARSED
+
+    The result is compared with its sign, as in the flip_number_sign setting:
+
+    >>> [check_calculation(*calculation) for calculation in [("-17+-18+-14", "-49"), ("-49--31", "-18"), ("5-10", "-5")]]
+    [(1, -49), (1, -18), (1, -5)]
+    >>> check_calculation("5-10", "5") == (WRONG, -5)
+    True
+    """
+    normalized = normalize_expression(expression)
+    if normalized is None:
+        return UNPARSED, None
+    value = evaluate_normalized(normalized)
+    # signed number of the whole result, "-49" stays negative; formulas do not convert
+    claimed = parse_result(result)
+    try:
+        claimed = float(claimed)
+    except ValueError:
+        return UNPARSED, value
+    if value is None:
+        return UNPARSED, None
+    return (CORRECT if _close(value, claimed) else WRONG), value
+
+
+def verify_response(text):
+    """
+    Returns:
+        {"num_calculations", "num_errors", "num_unchecked",
+         "errors": [{"expression", "result", "expected"}]}
+    """
+    errors = []
+    counts = [0, 0, 0]
+    for expression, result in CALC_RE.findall(text):
+        status, expected = check_calculation(expression, result)
+        counts[status] += 1
+        if status == WRONG:
+            errors.append({"expression": expression.strip(), "result": result.strip(), "expected": expected})
+    return {
+        "num_calculations": sum(counts),
+        "num_errors": counts[WRONG],
+        "num_unchecked": counts[UNPARSED],
+        "errors": errors,
+    }
+
+
+def count_errors(text):
+    """(calculations, arithmetic errors, unchecked) of one response"""
+    counts = [0, 0, 0]
+    for expression, result in CALC_RE.findall(text):
+        counts[check_calculation(expression, result)[0]] += 1
+    return counts[CORRECT] + counts[WRONG] + counts[UNPARSED], counts[WRONG], counts[UNPARSED]
+
+
+def _count_chunk(texts):
+    return [count_errors(text) for text in texts]
+
+
+def verify_responses(texts, workers=None, chunk_size=10000):
+    """
+    Per-response counts for many responses.
+
+    Returns:
+        int64 array (n, 3): calculations, arithmetic errors, unchecked annotations
+    """
+    if workers is None or workers <= 1:
+        rows = _count_chunk(texts)
+    else:
+        chunks = [texts[i: i + chunk_size] for i in range(0, len(texts), chunk_size)]
+        with Pool(workers) as pool:
+            rows = [row for chunk in pool.imap(_count_chunk, chunks) for row in chunk]
+    return np.array(rows, dtype=np.int64).reshape(-1, 3)
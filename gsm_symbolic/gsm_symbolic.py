@@ -1,32 +1,82 @@
 import json
 import random
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    StoppingCriteria,
-    StoppingCriteriaList,
-)
-import torch
+import re
 from tqdm import tqdm
 # from utils import create_folder
 # from config import GSM_SYMBOLIC_MODELS
 
+# torch / transformers take seconds to import, they are imported inside the functions
+# that run a model so the prompt helpers here stay cheap to import
 
-class KeywordStoppingCriteria(StoppingCriteria):
-    def __init__(self, keywords, tokenizer, prompt_length):
-        self.keywords = keywords
+
+# a complete "#### <number>" answer: the number is followed by something that is not part of it
+ANSWER_LINE_RE = re.compile(r"#### \$?\-?[0-9][0-9\.\,]*[^0-9\.\,]")
+
+STOP_REASONS = ["answer", "keyword", "eos", "max_new_tokens"]
+
+
+class TailStoppingCriteria:
+    """
+    transformers StoppingCriteria (duck-typed: generate() only calls it), so that
+    importing this module does not import transformers
+
+    Called after every new token, so a match can only end in the newest token: each step
+    decodes just the last `window` generated tokens of the rows that are not done yet,
+    instead of the whole generation. Subclasses define `matches(text)`.
+    """
+
+    def __init__(self, tokenizer, prompt_length, window):
         self.tokenizer = tokenizer
         self.prompt_length = prompt_length
+        self.window = window
+        self.done = None
+
+    def matches(self, text):
+        raise NotImplementedError
 
     def __call__(self, input_ids, scores, **kwargs):
+        """One flag per sequence of the batch, generate() stops each sequence on its own"""
+        import torch
+
         if (
             input_ids.shape[1] <= self.prompt_length
         ):  # Skip if we haven't generated beyond prompt
-            return False
+            self.done = None
+            return torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        if self.done is None or self.done.shape[0] != input_ids.shape[0]:
+            self.done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+
+        # Only decode the tail of the newly generated text (never the prompt), of open rows
+        start = max(self.prompt_length, input_ids.shape[1] - self.window)
+        rows = (~self.done).nonzero().flatten()
+        if len(rows):
+            tails = self.tokenizer.batch_decode(input_ids[rows, start:])
+            hits = [self.matches(text) for text in tails]
+            self.done[rows[torch.tensor(hits, dtype=torch.bool, device=rows.device)]] = True
+        return self.done.clone()
+
+
+class KeywordStoppingCriteria(TailStoppingCriteria):
+    """Stops a sequence once it generated one of the keywords (n characters span at most n tokens)"""
+
+    def __init__(self, keywords, tokenizer, prompt_length, window=None):
+        self.keywords = keywords
+        if window is None:
+            window = max(len(keyword) for keyword in keywords) + 2
+        super().__init__(tokenizer, prompt_length, window)
+
+    def matches(self, text):
+        return any(keyword in text for keyword in self.keywords)
+
+
+class AnswerStoppingCriteria(TailStoppingCriteria):
+    """Stops a sequence once it wrote a complete "#### <number>" (ANSWER_LINE_RE)"""
 
-        # Only decode the newly generated text (everything after the prompt)
-        generated_text = self.tokenizer.decode(input_ids[0][self.prompt_length :])
-        return any(keyword in generated_text for keyword in self.keywords)
+    def __init__(self, tokenizer, prompt_length, window=32):
+        super().__init__(tokenizer, prompt_length, window)
+
+    def matches(self, text):
+        return ANSWER_LINE_RE.search(text) is not None
 
 
 def load_examples(file_path="GSM_symbolic.jsonl"):
@@ -71,6 +121,9 @@ def format_prompt(shot_examples, new_question):
 
 def generate_response(model, tokenizer, prompt, apply_chat_template=False):
     """Generate a response using the model."""
+    import torch
+    from transformers import StoppingCriteriaList
+
     if apply_chat_template:
         messages = [
             {
@@ -111,28 +164,241 @@ def generate_response(model, tokenizer, prompt, apply_chat_template=False):
         )
 
     response = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    return extract_response_answer(response)
+
+
+def extract_response_answer(response):
+    """Text after the last "Answer:" of prompt + generation, without a trailing Question:"""
     answer = response.split("Answer:")[-1].strip()
     if answer.endswith("Question:"):
         answer = answer[: -len("Question:")].strip()
     return answer
 
 
+def tokenize_prompts(tokenizer, prompts, apply_chat_template=False):
+    """Token ids of every prompt (no padding), as generate_response tokenizes them"""
+    if apply_chat_template:
+        return [chat_input_ids(tokenizer, [{"role": "user", "content": prompt}]) for prompt in prompts]
+    return tokenizer(prompts)["input_ids"]
+
+
+def chat_input_ids(tokenizer, messages, add_generation_prompt=True):
+    """Token ids of a chat (list of {"role", "content"}) through the tokenizer's chat template"""
+    ids = tokenizer.apply_chat_template(messages, add_generation_prompt=add_generation_prompt, tokenize=True)
+    # newer transformers return a BatchEncoding instead of the list of ids
+    return list(ids["input_ids"]) if hasattr(ids, "keys") else list(ids)
+
+
+def length_batches(lengths, max_new_tokens, token_budget, max_batch_size=None):
+    """
+    Group prompt indices into batches of similar length, longest first.
+
+    A batch is left-padded to its longest prompt and grows by max_new_tokens, so it holds
+    as many prompts as fit batch_size * (longest prompt + max_new_tokens) <= token_budget
+    (at least one prompt).
+    """
+    order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+    batches, batch = [], []
+    for index in order:
+        # prompts come longest first, so the batch is padded to its first prompt
+        width = lengths[batch[0]] if batch else lengths[index]
+        full = max_batch_size is not None and len(batch) >= max_batch_size
+        if batch and (full or (len(batch) + 1) * (width + max_new_tokens) > token_budget):
+            batches.append(batch)
+            batch = []
+        batch.append(index)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def shared_prefix_length(sequences):
+    """Number of leading tokens all sequences share, leaving at least one token of each"""
+    if not sequences:
+        return 0
+    length = min(len(ids) for ids in sequences) - 1
+    first = sequences[0]
+    for ids in sequences[1:]:
+        common = 0
+        while common < length and ids[common] == first[common]:
+            common += 1
+        length = common
+    return max(length, 0)
+
+
+def prefill_prefix(model, prefix_ids):
+    """past_key_values of the shared prefix, computed once and copied for every batch"""
+    import torch
+
+    with torch.no_grad():
+        outputs = model(torch.tensor([prefix_ids], dtype=torch.long, device=model.device), use_cache=True)
+    return outputs.past_key_values
+
+
+def _generate_batch(
+    model, tokenizer, sequences, max_new_tokens, prefix_ids=(), prefix_cache=None, stop_on_answer=False
+):
+    """
+    Answers for token sequences that all follow prefix_ids. The sequences are left-padded to
+    the same width after the prefix; with prefix_cache the prefix is not encoded again.
+
+    Returns:
+        (answers, stop reasons), a reason of STOP_REASONS per sequence
+    """
+    import copy
+    import torch
+    from transformers import StoppingCriteriaList
+
+    pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    prefix_length = len(prefix_ids)
+    width = max(len(ids) for ids in sequences)
+    ids = torch.full((len(sequences), prefix_length + width), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros_like(ids)
+    ids[:, :prefix_length] = torch.tensor(list(prefix_ids), dtype=torch.long)
+    attention_mask[:, :prefix_length] = 1
+    for row, sequence in enumerate(sequences):
+        ids[row, prefix_length + width - len(sequence) :] = torch.tensor(sequence, dtype=torch.long)
+        attention_mask[row, prefix_length + width - len(sequence) :] = 1
+
+    kwargs = {}
+    if prefix_cache is not None:
+        # every batch gets its own copy, generate() extends the cache in place
+        cache = copy.deepcopy(prefix_cache)
+        cache.batch_repeat_interleave(len(sequences))
+        kwargs["past_key_values"] = cache
+
+    prompt_length = prefix_length + width
+    keyword_stop = KeywordStoppingCriteria(["Question:"], tokenizer, prompt_length=prompt_length)
+    answer_stop = AnswerStoppingCriteria(tokenizer, prompt_length=prompt_length) if stop_on_answer else None
+    with torch.no_grad():
+        outputs = model.generate(
+            ids.to(model.device),
+            attention_mask=attention_mask.to(model.device),
+            max_new_tokens=max_new_tokens,
+            pad_token_id=pad_token_id,
+            eos_token_id=tokenizer.eos_token_id,
+            stopping_criteria=StoppingCriteriaList(
+                [keyword_stop] + ([answer_stop] if answer_stop is not None else [])
+            ),
+            **kwargs,
+        )
+
+    answers, reasons = [], []
+    for row in range(len(sequences)):
+        # padding is skipped with the special tokens, as are tokens after a stop
+        tokens = outputs[row].tolist()
+        answers.append(extract_response_answer(tokenizer.decode(tokens, skip_special_tokens=True)))
+        if answer_stop is not None and answer_stop.done is not None and answer_stop.done[row]:
+            reasons.append("answer")
+        elif keyword_stop.done is not None and keyword_stop.done[row]:
+            reasons.append("keyword")
+        elif tokenizer.eos_token_id in tokens[prompt_length:]:
+            reasons.append("eos")
+        else:
+            reasons.append("max_new_tokens")
+    return answers, reasons
+
+
+def generate_responses(
+    model,
+    tokenizer,
+    prompts,
+    apply_chat_template=False,
+    max_new_tokens=1000,
+    token_budget=32768,
+    max_batch_size=None,
+    progress=True,
+    prefix_groups=None,
+    min_prefix_tokens=None,
+    stop_on_answer=False,
+    return_stop_reasons=False,
+):
+    """
+    Batched generate_response over many prompts, answers in the order of `prompts`.
+
+    Prompts are tokenized up front, grouped by length (length_batches), left-padded within a
+    batch and every sequence stops on its own at "Question:" or EOS.
+
+    With min_prefix_tokens, the prompts of each group of prefix_groups (lists of indices,
+    default: all prompts) that share at least that many leading tokens, e.g. the few-shot
+    examples, have the prefix encoded once (prefill_prefix); its past_key_values are copied
+    for every batch, so only the suffixes are encoded per question. Groups with a shorter
+    common prefix are generated without the cache.
+
+    stop_on_answer also stops a sequence right after its "#### <number>" line. With
+    return_stop_reasons, returns (answers, stop reasons), see STOP_REASONS.
+    """
+    input_ids = tokenize_prompts(tokenizer, prompts, apply_chat_template)
+    if prefix_groups is None:
+        prefix_groups = [list(range(len(prompts)))]
+    else:
+        prefix_groups = [list(group) for group in prefix_groups]
+
+    jobs = []  # (prefix ids, prefix cache or None, indices)
+    for group in prefix_groups:
+        prefix_length = shared_prefix_length([input_ids[i] for i in group]) if min_prefix_tokens else 0
+        if min_prefix_tokens and prefix_length < min_prefix_tokens:
+            prefix_length = 0
+        prefix_ids = input_ids[group[0]][:prefix_length] if group else []
+        lengths = [len(input_ids[i]) for i in group]
+        for batch in length_batches(lengths, max_new_tokens, token_budget, max_batch_size):
+            jobs.append((prefix_ids, [group[j] for j in batch]))
+
+    answers = [None] * len(prompts)
+    reasons = [None] * len(prompts)
+    caches = {}
+    for prefix_ids, batch in tqdm(jobs, disable=not progress):
+        prefix_cache = None
+        if prefix_ids:
+            key = tuple(prefix_ids)
+            if key not in caches:
+                caches.clear()  # groups come one after the other, keep one prefix at a time
+                caches[key] = prefill_prefix(model, prefix_ids)
+            prefix_cache = caches[key]
+        sequences = [input_ids[i][len(prefix_ids) :] for i in batch]
+        batch_answers, batch_reasons = _generate_batch(
+            model, tokenizer, sequences, max_new_tokens, prefix_ids, prefix_cache, stop_on_answer
+        )
+        for i, answer, reason in zip(batch, batch_answers, batch_reasons):
+            answers[i], reasons[i] = answer, reason
+    if return_stop_reasons:
+        return answers, reasons
+    return answers
+
+
 def main(
     model_id,
     apply_chat_template,
     num_questions,
     num_variants,
+    server_url=None,
 ):
-    seed = 42
-    random.seed(seed)
-    torch.manual_seed(seed)
-    torch.cuda.manual_seed(seed)
-
+    """With server_url, prompts go to a running inference_server instead of a model loaded here"""
     model_name = GSM_SYMBOLIC_MODELS[model_id]
-    model = AutoModelForCausalLM.from_pretrained(
-        model_name, torch_dtype=torch.bfloat16, device_map="cuda"
-    )
-    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    random.seed(42)
+    if server_url:
+        from .inference_client import InferenceClient
+
+        client = InferenceClient(server_url)
+
+        def respond(prompt, apply_chat_template=False):
+            result = client.generate(model_name, [prompt], apply_chat_template=apply_chat_template)[0]
+            return extract_response_answer(result["text"])
+    else:
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        seed = 42
+        torch.manual_seed(seed)
+        torch.cuda.manual_seed(seed)
+
+        model = AutoModelForCausalLM.from_pretrained(
+            model_name, torch_dtype=torch.bfloat16, device_map="cuda"
+        )
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+        def respond(prompt, apply_chat_template=False):
+            return generate_response(model, tokenizer, prompt, apply_chat_template)
 
     few_shot_examples = load_few_shot_examples()
     examples = load_examples()
@@ -146,7 +412,7 @@ def main(
 
         # First generate response for the original question
         prompt = format_prompt(few_shot_examples, original_question["question"])
-        response = generate_response(model, tokenizer, prompt, apply_chat_template)
+        response = respond(prompt, apply_chat_template)
         results = [
             {
                 "prompt": prompt,
@@ -159,7 +425,7 @@ def main(
         # Then generate response for new questions
         for new_question in questions_variants:
             prompt = format_prompt(few_shot_examples, new_question["question"])
-            response = generate_response(model, tokenizer, prompt)
+            response = respond(prompt)
             results.append(
                 {
                     # "prompt": prompt,
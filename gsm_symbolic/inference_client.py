@@ -0,0 +1,82 @@
+"""
+Client of the local inference server (inference_server.py), standard library only.
+
+    client = InferenceClient()  # http://127.0.0.1:8765
+    results = client.generate("google/gemma-2-9b", prompts, max_new_tokens=1000, stop_on_answer=True)
+    answers = [extract_response_answer(result["text"]) for result in results]
+"""
+import json
+import time
+import urllib.error
+import urllib.request
+
+from .inference_server import DEFAULT_PORT
+
+DEFAULT_URL = f"http://127.0.0.1:{DEFAULT_PORT}"
+# seconds a /generate call may take, a whole results file of 1000-token answers fits
+DEFAULT_TIMEOUT = 3600.0
+
+
+class InferenceClient:
+    def __init__(self, url=DEFAULT_URL, timeout=DEFAULT_TIMEOUT):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(
+            self.url + path, data=data, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as error:
+            raise RuntimeError(f"inference server: {json.loads(error.read()).get('error')}") from error
+
+    def health(self):
+        return self._request("/health")
+
+    def wait(self, timeout=60.0, interval=0.5):
+        """Block until the server answers, e.g. right after starting it"""
+        deadline = time.time() + timeout
+        while True:
+            try:
+                return self.health()
+            except (urllib.error.URLError, ConnectionError):
+                if time.time() > deadline:
+                    raise
+                time.sleep(interval)
+
+    def generate(
+        self,
+        model,
+        prompts=None,
+        messages=None,
+        max_new_tokens=1000,
+        stop=("Question:",),
+        stop_on_answer=False,
+        temperature=0.0,
+        apply_chat_template=False,
+        add_generation_prompt=True,
+    ):
+        """
+        Generate for a list of prompts, or of chats (lists of {"role", "content"}) with messages.
+
+        Returns:
+            [{"text": prompt + completion, "completion", "stop_reason", "prompt_tokens",
+              "completion_tokens"}], in input order
+        """
+        body = {
+            "model": model,
+            "max_new_tokens": max_new_tokens,
+            "stop": list(stop or []),
+            "stop_on_answer": stop_on_answer,
+            "temperature": temperature,
+            "apply_chat_template": apply_chat_template,
+            "add_generation_prompt": add_generation_prompt,
+        }
+        if messages is not None:
+            body["messages"] = messages
+        else:
+            body["prompts"] = list(prompts)
+        return self._request("/generate", body)["results"]
@@ -0,0 +1,451 @@
+"""
+Long-lived local inference server with continuous batching.
+
+Models stay loaded between runs: the server loads a model on its first request (or at start
+with --preload) and keeps it. Every model has one engine thread that decodes all sequences
+of all clients in one batch, one token per step. New requests join the running batch at
+the next step: they are prefilled on their own, their KV cache is left-padded to the
+length of the running cache and concatenated to it. Finished sequences leave the batch
+right away, without waiting for the rest of the batch.
+
+Models whose cache has sliding-window layers (e.g. gemma-2) cannot have caches merged
+this way. For them, new requests wait until the running batch is done.
+
+    python -m gsm_symbolic.inference_server --port 8765 --preload google/gemma-2-9b-it
+    python -m gsm_symbolic.inference_server --tiny   # tiny random model on CPU
+
+HTTP API (JSON), see inference_client.InferenceClient:
+    GET  /health    {"models": [loaded model names]}
+    POST /generate  {"model", "prompts" | "messages", "max_new_tokens", "stop",
+                     "stop_on_answer", "temperature", "apply_chat_template", "add_generation_prompt"}
+                 -> {"results": [{"text", "completion", "stop_reason", "prompt_tokens", "completion_tokens"}]}
+"""
+import argparse
+import json
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .gsm_symbolic import (
+    AnswerStoppingCriteria,
+    KeywordStoppingCriteria,
+    chat_input_ids,
+    tokenize_prompts,
+)
+from .tiny_model import TINY_MODEL_ID, load_tiny
+
+DEFAULT_PORT = 8765
+
+
+class RequestError(ValueError):
+    """Malformed /generate request, answered with 400"""
+
+
+def _check(condition, message):
+    if not condition:
+        raise RequestError(message)
+
+
+def validate_request(request):
+    """Type-check a /generate request before anything reaches an Engine"""
+    _check(isinstance(request, dict), "request must be a JSON object")
+    _check(isinstance(request.get("model"), str), "model must be a string")
+    _check(("prompts" in request) != ("messages" in request), "give either prompts or messages")
+    if "prompts" in request:
+        prompts = request["prompts"]
+        _check(isinstance(prompts, list) and prompts, "prompts must be a non-empty list")
+        _check(all(isinstance(prompt, str) for prompt in prompts), "prompts must be strings")
+    else:
+        chats = request["messages"]
+        _check(isinstance(chats, list) and chats, "messages must be a non-empty list of chats")
+        for chat in chats:
+            _check(isinstance(chat, list) and all(
+                isinstance(message, dict) and isinstance(message.get("role"), str)
+                and isinstance(message.get("content"), str)
+                for message in chat
+            ), "every chat must be a list of {\"role\": str, \"content\": str}")
+    max_new_tokens = request.get("max_new_tokens", 1000)
+    _check(isinstance(max_new_tokens, int) and not isinstance(max_new_tokens, bool) and max_new_tokens > 0,
+           "max_new_tokens must be a positive integer")
+    temperature = request.get("temperature", 0.0)
+    _check(isinstance(temperature, (int, float)) and not isinstance(temperature, bool) and temperature >= 0,
+           "temperature must be a non-negative number")
+    stop = request.get("stop", ["Question:"])
+    _check(stop is None or (isinstance(stop, list) and all(isinstance(keyword, str) and keyword for keyword in stop)),
+           "stop must be a list of non-empty strings")
+    for key in ["stop_on_answer", "apply_chat_template", "add_generation_prompt"]:
+        _check(isinstance(request.get(key, False), bool), f"{key} must be a boolean")
+
+
+class Sequence:
+    """One prompt of a request, generated by an Engine"""
+
+    def __init__(self, input_ids, max_new_tokens, stop, stop_on_answer, temperature, tokenizer):
+        self.input_ids = list(input_ids)
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.keyword_stop = KeywordStoppingCriteria(stop, tokenizer, 0) if stop else None
+        self.answer_stop = AnswerStoppingCriteria(tokenizer, 0) if stop_on_answer else None
+        self.generated = []
+        self.stop_reason = None
+        self.future = Future()
+
+    def cost(self):
+        return len(self.input_ids) + self.max_new_tokens
+
+
+def _cache_tensors(cache):
+    """[(keys, values)] per layer, keys / values are (batch, heads, length, head_dim)"""
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _make_cache(tensors):
+    from transformers import DynamicCache
+
+    return DynamicCache(tensors)
+
+
+def _has_sliding_layers(cache):
+    return any(getattr(layer, "is_sliding", False) for layer in getattr(cache, "layers", []))
+
+
+class Engine(threading.Thread):
+    """
+    Continuous batching over one model.
+
+    The running batch keeps one left-padded KV cache and its attention mask. The cache holds
+    every token of every row except the last generated one, which is the next step's input.
+    """
+
+    def __init__(self, model, tokenizer, max_batch_size=32, token_budget=65536):
+        super().__init__(daemon=True)
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_batch_size = max_batch_size
+        self.token_budget = token_budget
+        self.queue = queue.Queue()
+        # sequences taken off the queue that did not fit yet, they go first on the next step
+        self.pending = deque()
+        # sequences being prefilled, not in self.active yet
+        self.admitting = []
+        self.active = []
+        self.cache = None
+        self.attention_mask = None
+        self.can_merge = True
+        self.steps = 0
+
+    def submit(self, sequence):
+        self.queue.put(sequence)
+        return sequence.future
+
+    # batch bookkeeping
+
+    def _next(self, block):
+        """Next waiting sequence, those held back in self.pending first; None if there is none"""
+        if self.pending:
+            return self.pending.popleft()
+        try:
+            return self.queue.get(block=block)
+        except queue.Empty:
+            return None
+
+    def _admit(self):
+        """Sequences from the queue that fit next to the running batch"""
+        admitted = []
+        if not self.active:
+            admitted.append(self._next(block=True))
+        elif not self.can_merge:
+            return admitted
+        used = sum(sequence.cost() for sequence in self.active + admitted)
+        while len(self.active) + len(admitted) < self.max_batch_size:
+            sequence = self._next(block=False)
+            if sequence is None:
+                break
+            if used + sequence.cost() > self.token_budget and (self.active or admitted):
+                # first in line on the next step, ahead of later arrivals
+                self.pending.appendleft(sequence)
+                break
+            admitted.append(sequence)
+            used += sequence.cost()
+        return admitted
+
+    def _prefill(self, sequences):
+        """Encode new prompts, left-padded; returns their cache, attention mask and last logits"""
+        import torch
+
+        device = self.model.device
+        pad_token_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        width = max(len(sequence.input_ids) for sequence in sequences)
+        ids = torch.full((len(sequences), width), pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(ids)
+        for row, sequence in enumerate(sequences):
+            ids[row, width - len(sequence.input_ids):] = torch.tensor(sequence.input_ids, dtype=torch.long)
+            attention_mask[row, width - len(sequence.input_ids):] = 1
+        ids, attention_mask = ids.to(device), attention_mask.to(device)
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        outputs = self.model(
+            input_ids=ids, attention_mask=attention_mask, position_ids=position_ids,
+            use_cache=True, logits_to_keep=1,
+        )
+        return outputs.past_key_values, attention_mask, outputs.logits[:, -1]
+
+    def _merge(self, cache, attention_mask):
+        """Append prefilled rows to the running batch, left-padding the shorter cache"""
+        import torch
+        import torch.nn.functional as F
+
+        if self.cache is None:
+            self.cache, self.attention_mask = cache, attention_mask
+            self.can_merge = not _has_sliding_layers(cache)
+            return
+        length = max(self.attention_mask.shape[1], attention_mask.shape[1])
+
+        def pad(tensor, dim_from_end):
+            missing = length - tensor.shape[-dim_from_end]
+            if missing == 0:
+                return tensor
+            return F.pad(tensor, (0, 0) * (dim_from_end - 1) + (missing, 0))
+
+        tensors = [
+            (torch.cat([pad(k1, 2), pad(k2, 2)]), torch.cat([pad(v1, 2), pad(v2, 2)]))
+            for (k1, v1), (k2, v2) in zip(_cache_tensors(self.cache), _cache_tensors(cache))
+        ]
+        self.cache = _make_cache(tensors)
+        self.attention_mask = torch.cat([pad(self.attention_mask, 1), pad(attention_mask, 1)])
+
+    def _retire(self, keep):
+        """Keep only the rows in `keep`, dropping cache columns no remaining row attends to"""
+        import torch
+
+        if not keep:
+            self.active, self.cache, self.attention_mask = [], None, None
+            return
+        index = torch.tensor(keep, dtype=torch.long, device=self.attention_mask.device)
+        attention_mask = self.attention_mask[index]
+        start = int(attention_mask.any(0).long().argmax())
+        self.cache = _make_cache([
+            (keys[index, :, start:], values[index, :, start:]) for keys, values in _cache_tensors(self.cache)
+        ])
+        self.attention_mask = attention_mask[:, start:]
+        self.active = [self.active[i] for i in keep]
+
+    # decoding
+
+    def _pick(self, logits, sequences):
+        import torch
+
+        tokens = logits.argmax(-1)
+        for row, sequence in enumerate(sequences):
+            if sequence.temperature and sequence.temperature > 0:
+                probs = torch.softmax(logits[row].float() / sequence.temperature, -1)
+                tokens[row] = torch.multinomial(probs, 1)[0]
+        return tokens.tolist()
+
+    def _append(self, sequence, token):
+        """Add a generated token, returns whether the sequence is finished"""
+        sequence.generated.append(token)
+        if token == self.tokenizer.eos_token_id:
+            sequence.stop_reason = "eos"
+        elif sequence.answer_stop is not None and sequence.answer_stop.matches(
+            self.tokenizer.decode(sequence.generated[-sequence.answer_stop.window:])
+        ):
+            sequence.stop_reason = "answer"
+        elif sequence.keyword_stop is not None and sequence.keyword_stop.matches(
+            self.tokenizer.decode(sequence.generated[-sequence.keyword_stop.window:])
+        ):
+            sequence.stop_reason = "keyword"
+        elif len(sequence.generated) >= sequence.max_new_tokens:
+            sequence.stop_reason = "max_new_tokens"
+        return sequence.stop_reason is not None
+
+    def _finish(self, sequence):
+        decode = self.tokenizer.decode
+        sequence.future.set_result({
+            "text": decode(sequence.input_ids + sequence.generated, skip_special_tokens=True),
+            "completion": decode(sequence.generated, skip_special_tokens=True),
+            "stop_reason": sequence.stop_reason,
+            "prompt_tokens": len(sequence.input_ids),
+            "completion_tokens": len(sequence.generated),
+        })
+
+    def step(self):
+        """Admit waiting requests, then decode one token for every running sequence"""
+        import torch
+
+        admitted = self.admitting = self._admit()
+        with torch.no_grad():
+            if admitted:
+                cache, attention_mask, logits = self._prefill(admitted)
+                for sequence, token in zip(admitted, self._pick(logits, admitted)):
+                    self._append(sequence, token)
+                self._merge(cache, attention_mask)
+                self.active += admitted
+                self.admitting = []
+                keep = []
+                for i, sequence in enumerate(self.active):
+                    if sequence.stop_reason is None:
+                        keep.append(i)
+                    else:
+                        self._finish(sequence)
+                if len(keep) < len(self.active):
+                    self._retire(keep)
+            if not self.active:
+                return
+
+            device = self.attention_mask.device
+            last = torch.tensor([[sequence.generated[-1]] for sequence in self.active], dtype=torch.long, device=device)
+            position_ids = self.attention_mask.sum(-1, keepdim=True)
+            self.attention_mask = torch.cat(
+                [self.attention_mask, torch.ones((len(self.active), 1), dtype=self.attention_mask.dtype, device=device)], -1
+            )
+            outputs = self.model(
+                input_ids=last, attention_mask=self.attention_mask, position_ids=position_ids,
+                past_key_values=self.cache, use_cache=True,
+            )
+            self.cache = outputs.past_key_values
+            keep = []
+            for i, (sequence, token) in enumerate(zip(self.active, self._pick(outputs.logits[:, -1], self.active))):
+                if self._append(sequence, token):
+                    self._finish(sequence)
+                else:
+                    keep.append(i)
+            self.steps += 1
+            if len(keep) < len(self.active):
+                self._retire(keep)
+
+    def run(self):
+        while True:
+            try:
+                self.step()
+            except Exception as error:  # fail the running and admitted requests, keep serving
+                for sequence in self.active + self.admitting:
+                    if not sequence.future.done():
+                        sequence.future.set_exception(error)
+                self.active, self.admitting, self.cache, self.attention_mask = [], [], None, None
+
+
+def load_model(name, device="cuda"):
+    """(model, tokenizer); "tiny_random" is the tiny random model on CPU"""
+    if name == TINY_MODEL_ID:
+        return load_tiny()
+    import torch
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(name, torch_dtype=torch.bfloat16, device_map=device)
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    if tokenizer.pad_token_id is None:
+        tokenizer.pad_token_id = tokenizer.eos_token_id
+    return model.eval(), tokenizer
+
+
+class InferenceServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, device="cuda", max_batch_size=32, token_budget=65536):
+        super().__init__(address, _Handler)
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.token_budget = token_budget
+        self.engines = {}
+        self.lock = threading.Lock()
+
+    def engine(self, name):
+        """Engine of a model, loaded on first use and kept"""
+        with self.lock:
+            if name not in self.engines:
+                model, tokenizer = load_model(name, self.device)
+                engine = Engine(model, tokenizer, self.max_batch_size, self.token_budget)
+                engine.start()
+                self.engines[name] = engine
+            return self.engines[name]
+
+    def generate(self, request):
+        validate_request(request)
+        engine = self.engine(request["model"])
+        tokenizer = engine.tokenizer
+        if "messages" in request:
+            input_ids = [
+                chat_input_ids(tokenizer, messages, request.get("add_generation_prompt", True))
+                for messages in request["messages"]
+            ]
+        else:
+            input_ids = tokenize_prompts(tokenizer, request["prompts"], request.get("apply_chat_template", False))
+        futures = [
+            engine.submit(Sequence(
+                ids,
+                request.get("max_new_tokens", 1000),
+                request.get("stop", ["Question:"]),
+                request.get("stop_on_answer", False),
+                request.get("temperature", 0.0),
+                tokenizer,
+            ))
+            for ids in input_ids
+        ]
+        return [future.result() for future in futures]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"models": list(self.server.engines)})
+        else:
+            self._reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._reply(404, {"error": f"unknown path {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        except ValueError as error:
+            self._reply(400, {"error": f"invalid JSON: {error}"})
+            return
+        try:
+            self._reply(200, {"results": self.server.generate(request)})
+        except RequestError as error:
+            self._reply(400, {"error": str(error)})
+        except Exception as error:
+            self._reply(500, {"error": f"{type(error).__name__}: {error}"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--device", type=str, default="cuda")
+    parser.add_argument("--preload", type=str, nargs="*", default=[], help="models to load at start")
+    parser.add_argument("--max_batch_size", type=int, default=32)
+    parser.add_argument("--token_budget", type=int, default=65536, help="max (prompt + new) tokens in the running batch")
+    parser.add_argument("--tiny", action="store_true", help=f"preload {TINY_MODEL_ID} and run on CPU")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    preload = list(args.preload) + ([TINY_MODEL_ID] if args.tiny else [])
+    server = InferenceServer(
+        (args.host, args.port), "cpu" if args.tiny else args.device, args.max_batch_size, args.token_budget
+    )
+    for name in preload:
+        server.engine(name)
+    print(f"serving {preload} on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Tiny randomly initialised causal LM with a byte-level tokenizer, built offline.
+
+It generates noise, but it exercises batching, padding and stopping end to end on CPU
+without downloading a checkpoint, e.g. `python eval.py run --tiny`.
+"""
+
+TINY_MODEL_ID = "tiny_random"
+
+
+def tiny_tokenizer():
+    """Byte-level tokenizer: the 256 bytes plus <bos> / <eos> / <pad>, with a minimal chat template"""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast
+
+    alphabet = pre_tokenizers.ByteLevel.alphabet()
+    vocab = {token: i for i, token in enumerate(["<bos>", "<eos>", "<pad>"] + sorted(alphabet))}
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<bos> $A", special_tokens=[("<bos>", vocab["<bos>"])]
+    )
+    tokenizer = PreTrainedTokenizerFast(
+        tokenizer_object=tokenizer, bos_token="<bos>", eos_token="<eos>", pad_token="<pad>"
+    )
+    # plain "role: content" lines, so chat prompts work in test mode too
+    tokenizer.chat_template = (
+        "{% for message in messages %}{{ message['role'] }}: {{ message['content'] }}\n{% endfor %}"
+        "{% if add_generation_prompt %}assistant:{% endif %}"
+    )
+    return tokenizer
+
+
+def tiny_model(tokenizer, seed=0, hidden_size=64, num_layers=2):
+    """Random Llama-architecture model over the tokenizer's vocabulary, in float32 on CPU"""
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    torch.manual_seed(seed)
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=hidden_size,
+        intermediate_size=hidden_size * 2,
+        num_hidden_layers=num_layers,
+        num_attention_heads=4,
+        num_key_value_heads=4,
+        max_position_embeddings=8192,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+    )
+    return LlamaForCausalLM(config).eval()
+
+
+def load_tiny(seed=0):
+    """(model, tokenizer)"""
+    tokenizer = tiny_tokenizer()
+    return tiny_model(tokenizer, seed), tokenizer
@@ -2,7 +2,11 @@ import json
 from collections import defaultdict
 from utils import ensure_path, load_json, save_json
 import argparse
-from gsm_parse.gsm_parser import parse_computation_graph, print_ascii_tree, visualize_graph_graphviz
+from gsm_parse.gsm_parser import parse_computation_graph, print_ascii_tree
+from gsm_parse.graph_store import open_store
+from gsm_parse.graph_render import GraphRenderer
+from gsm_parse.graph_hash import GraphHashIndex, graph_hash, match_rates
+from gsm_parse.graph_analytics import FEATURES, feature_matrix
 
 EVAL_MODELS = {
     "gemma_9B_it": "google/gemma-2-9b-it",
@@ -14,15 +18,104 @@ EVAL_MODELS = {
     "gemma_9B": "google/gemma-2-9b",
 }
 
+def structural_match(model_ids, questions_path = "out/question_variations_with_context.json"):
+    """
+    Whether each response graph equals its ground-truth graph, for all models in one pass.
+
+    Graphs are compared by canonical hash (gsm_parse/graph_hash.py): "graph" also compares
+    the numbers, "structure" only the shape and the operations. Responses that do not match
+    their own ground truth are looked up in an index of all ground-truth graphs, e.g. a
+    response that reproduces another question of the prompt.
+
+    Returns:
+        {model_id: {"graph": {...}, "structure": {...}}}, each with rates overall, by seed and by wording
+    """
+    import numpy as np
+
+    questions = load_json(questions_path)
+    # graphs are parsed once and kept in out/graph_store, see gsm_parse/graph_store.py
+    gt_store = open_store(questions_path, "ground_truth", text_key = "deduction")
+    # ground truth, hashed once per distinct deduction
+    gt_hashes = {}
+    gt_index = GraphHashIndex()
+    for question in questions:
+        deduction = question["deduction"]
+        if deduction not in gt_hashes:
+            gt = gt_store[("ground_truth", question["sample_id"])]
+            gt_hashes[deduction] = (graph_hash(gt), graph_hash(gt, values = False))
+        gt_index.add(gt_hashes[deduction][0], question["sample_id"])
+    gt_store.close()
+
+    models, seeds, wordings, sample_ids, hashes, gt = [], [], [], [], [], []
+    for model_id in model_ids:
+        store = open_store(f"data/results/Tree_Logging_Calculation_{model_id}.json", model_id)
+        results = load_json(f"data/results/Tree_Logging_Calculation_{model_id}.json")
+        for question, item in zip(questions, results):
+            response = store[(model_id, item["sample_id"])]
+            models.append(model_id)
+            seeds.append(question["seed"])
+            wordings.append(question["wording"])
+            sample_ids.append(question["sample_id"])
+            hashes.append((graph_hash(response), graph_hash(response, values = False)))
+            gt.append(gt_hashes[question["deduction"]])
+        store.close()
+
+    hashes = np.array(hashes, dtype = np.uint64).reshape(-1, 2)
+    gt = np.array(gt, dtype = np.uint64).reshape(-1, 2)
+    matches = hashes == gt
+    models = np.array(models)
+    by_seed = np.array([f"{model}/{seed}" for model, seed in zip(models, seeds)])
+    by_wording = np.array([f"{model}/{wording}" for model, wording in zip(models, wordings)])
+
+    copied = np.array([
+        not match and any(other != sample_id for other in gt_index.lookup(hash_value))
+        for match, hash_value, sample_id in zip(matches[:, 0], hashes[:, 0], sample_ids)
+    ], dtype = bool)
+
+    report = {}
+    for column, kind in enumerate(["graph", "structure"]):
+        overall = match_rates(matches[:, column], models)
+        seed_rates = match_rates(matches[:, column], by_seed)
+        wording_rates = match_rates(matches[:, column], by_wording)
+        for model_id in model_ids:
+            report.setdefault(model_id, {})[kind] = {
+                "match_rate": overall.get(model_id, 0.0),
+                "match_rate_by_seed": {key.split("/", 1)[1]: rate for key, rate in seed_rates.items() if key.startswith(model_id + "/")},
+                "match_rate_by_wording": {key.split("/", 1)[1]: rate for key, rate in wording_rates.items() if key.startswith(model_id + "/")},
+            }
+    for model_id, rate in match_rates(copied, models).items():
+        report[model_id]["graph"]["other_ground_truth_rate"] = rate
+    return report
+
+
+def graph_feature_means(model_id):
+    """Mean shape features (gsm_parse/graph_analytics.py) of the response graphs, for correct and wrong answers"""
+    results_path = f"data/results/Tree_Logging_Calculation_{model_id}.json"
+    correct = {item["sample_id"]: bool(item.get("correct", False)) for item in load_json(results_path)}
+    with open_store(results_path, model_id) as store:
+        keys, graphs = zip(*store.items()) if len(store) else ((), ())
+    features = feature_matrix(graphs)
+    mask = [correct[sample_id] for _, sample_id in keys]
+    means = {}
+    for name, rows in [("correct", features[mask]), ("wrong", features[[not m for m in mask]])]:
+        means[name] = {feature: float(value) for feature, value in zip(FEATURES, rows.mean(axis = 0))} if len(rows) else {}
+    return means
+
+
 def parse_results(
         model_id = "gemma_9B_it",
         graph = False,
+        graph_format = "png",
         ):
     """Parse model outputs and calculate accuracy metrics."""
     # Load results
     results = load_json(f"data/results/Tree_Logging_Calculation_{model_id}.json")
     questions = load_json("out/question_variations_with_context.json")
     
+    # graphs are queued and rendered together at the end, identical graphs only once
+    renderer = GraphRenderer(format = graph_format) if graph else None
+    store = open_store(f"data/results/Tree_Logging_Calculation_{model_id}.json", model_id) if graph else None
+
     # Initialize counters
     total_by_seed = defaultdict(int)
     correct_by_seed = defaultdict(int)
@@ -48,16 +141,19 @@ def parse_results(
         if correct:
             correct_by_wording[wording] += 1
         
-        # answer text parse to graph
-        answer_text = item.get('response', "")
+        # parsed graph of the answer text
         if graph:
             try:
-                graph = parse_computation_graph(answer_text, None, None)
-                visualize_graph_graphviz(graph, output_file = f"out/seed{seed}/{model_id}/{wording}_computation_graph")
+                renderer.add(store[(model_id, item["sample_id"])],
+                             f"out/seed{seed}/{model_id}/{wording}_computation_graph")
             except Exception as e:
                 print(f"Error parsing graph for sample_id {question['sample_id']} seed {seed}, wording {wording}: {e}")
                 continue
 
+    if renderer is not None:
+        renderer.flush()
+        store.close()
+
     # Calculate accuracies
     accuracy_by_seed = {
         seed: correct_by_seed[seed] / total_by_seed[seed] 
@@ -86,7 +182,9 @@ def parse_results(
             "correct_by_seed": dict(correct_by_seed),
             "by_wording": dict(total_by_wording),
             "correct_by_wording": dict(correct_by_wording)
-        }
+        },
+        "structural_match": structural_match([model_id])[model_id],
+        "graph_features": graph_feature_means(model_id),
     }
 
     # Save analysis
@@ -111,7 +209,15 @@ def main(model_id = "gemma_9B_it"):
     for wording, acc in analysis["accuracy_by_wording"].items():
         print(f"{wording}: {acc:.2%}")
 
+    match = analysis["structural_match"]
+    print("\nGraph / structure match with the ground truth: {:.2%} / {:.2%}".format(
+        match["graph"]["match_rate"], match["structure"]["match_rate"]))
+
 if __name__ == "__main__":
 
     for model_id in EVAL_MODELS:
         main(model_id)
+
+    # all models side by side
+    ensure_path(f"data/analysis")
+    save_json(structural_match(list(EVAL_MODELS)), "data/analysis/structural_match.json")
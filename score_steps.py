@@ -0,0 +1,82 @@
+"""
+Step-level scores of model responses against the ground-truth deductions.
+
+Every response of every results file is aligned with the graph of its deduction
+(gsm_parse/alignment.py) in one process pool, and every <<expression=result>> annotation
+is checked for arithmetic errors (gsm_parse/verifier.py).
+
+python score_steps.py --results "data/results/*.json" --workers 8
+"""
+import argparse
+import glob
+import os
+from collections import defaultdict
+
+from utils import ensure_path, load_json, save_json
+from gsm_parse.alignment import align_items, step_accuracy, step_summary
+from gsm_parse.verifier import verify_responses
+
+
+def score_files(paths, workers=None):
+    """{results file name: step accuracy curves and per-sample step summaries}"""
+    items, owners = [], []
+    for path in paths:
+        results = load_json(path)
+        items += [{"deduction": item["deduction"], "response": item.get("response", "")} for item in results]
+        owners += [(path, item) for item in results]
+
+    alignments = align_items(items, workers=workers)
+    # calculations, arithmetic errors, unchecked annotations per response
+    counts = verify_responses([item["response"] for item in items], workers=workers)
+
+    # row indices of every results file, in one pass
+    rows_of = defaultdict(list)
+    for i, (owner, _) in enumerate(owners):
+        rows_of[owner].append(i)
+
+    scores = {}
+    for path in paths:
+        rows = rows_of[path]
+        pairs = [(owners[i][1], alignments[i], counts[i]) for i in rows]
+        scores[os.path.basename(path)] = {
+            **step_accuracy([alignment for _, alignment, _ in pairs]),
+            "arithmetic_errors": int(counts[rows, 1].sum()),
+            "calculations": int(counts[rows, 0].sum()),
+            "samples": [
+                {
+                    "sample_id": item.get("sample_id"),
+                    "seed": item.get("seed"),
+                    "wording": item.get("wording"),
+                    "answer_correct": item.get("correct"),
+                    **step_summary(alignment),
+                    "calculations": int(count[0]),
+                    "arithmetic_errors": int(count[1]),
+                }
+                for item, alignment, count in pairs
+            ],
+        }
+    return scores
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--results", type=str, default="data/results/*.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--output", type=str, default="data/analysis/step_scores.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    paths = sorted(glob.glob(args.results))
+    scores = score_files(paths, workers=args.workers)
+    for name, score in scores.items():
+        curve = " ".join(f"{rate:.2f}" for rate in score["correct_by_step"].values())
+        print(f"{name:<50} correct by step: {curve}   {score['status_counts']}, extra {score['extra_steps']}, "
+              f"arithmetic errors {score['arithmetic_errors']}/{score['calculations']}")
+    ensure_path(os.path.dirname(args.output))
+    save_json(scores, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import os
+import ast
+import operator
 from typing import Optional, List, Dict, Union, Tuple
 import dataclasses
 import sys
@@ -12,6 +14,26 @@ https://stackoverflow.com/questions/6881170/is-there-a-way-to-autogenerate-valid
 However, I sorta don't like it because of the use of recursive definition and uncontrolled length and parentheses
 """
 
+_SAFE_OPS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul}
+
+def safe_eval(expression: str) -> int:
+    """
+    Evaluate an integer expression with +, -, * and parentheses, without eval()
+    (anything else, e.g. names or calls, raises ValueError)
+    """
+    def _eval(node):
+        if isinstance(node, ast.Expression):
+            return _eval(node.body)
+        if isinstance(node, ast.Constant) and type(node.value) is int:
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _SAFE_OPS:
+            return _SAFE_OPS[type(node.op)](_eval(node.left), _eval(node.right))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            value = _eval(node.operand)
+            return -value if isinstance(node.op, ast.USub) else value
+        raise ValueError(f"unsupported expression: {expression}")
+    return _eval(ast.parse(expression, mode="eval"))
+
 def gen_prob(prob: Union[list, None], L: int):
     """
     simple function that returns a uniform probability vector in np.array
@@ -160,9 +182,10 @@ class simpleReasoning():
         Evaluate a simple arithmetic modular expression
         """
         try:
-            result = eval(self.map_ids_to_str(ids))
+            result = safe_eval(self.map_ids_to_str(ids))
         except SyntaxError as e:
             print(f"SyntaxError: {e}")
+            raise
         val = self.vocab["variables"][result % self.mod]
         return val
     
@@ -2,6 +2,7 @@ import json
 import time 
 import os
 import sys
+from contextlib import contextmanager
 
 # Function to load JSON data from a file
 def load_json(file_path):
@@ -13,6 +14,25 @@ def save_json(data, file_path, indent = 4):
     with open(file_path, 'w') as file:
         json.dump(data, file, indent = indent)
 
+def save_json_atomic(data, file_path, indent = 4):
+    """save_json via a temporary file + rename, readers never see a partial file"""
+    print(f"save to {file_path}, data length {len(data)}")
+    tmp_path = f"{file_path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent = indent)
+    os.replace(tmp_path, file_path)
+
+@contextmanager
+def file_lock(path):
+    """Exclusive advisory lock on `path`.lock, serializes read-modify-write of shared files"""
+    import fcntl
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 # Function to load JSON data from a file line by line
 def load_json_lines(file_path):
     data = []